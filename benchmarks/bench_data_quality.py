@@ -0,0 +1,18 @@
+"""Times DataValidationTests.assertion_tests on every row of a cleaned DataFrame, against the 28-row sample it previously ran on.
+
+Run with: PYTHONPATH=src python benchmarks/bench_data_quality.py [rows]
+"""
+import sys
+from whoop_pipeline.models import Cycle
+from whoop_pipeline.test_data_quality import DataValidationTests
+from common import best_of, make_cycles
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    validator = DataValidationTests()
+    df = make_cycles(rows)
+
+    sample = best_of(lambda: validator.assertion_tests(df.sample(n=28, random_state=42), Cycle))
+    full = best_of(lambda: validator.assertion_tests(df, Cycle))
+    print(f"{rows} rows: 28-row sample {sample:.4f}s, every row {full:.4f}s")
@@ -0,0 +1,50 @@
+"""Compares the memory and time of turning a cleaned DataFrame into driver parameters: the original df.where/to_dict('records') row-dict path,
+today's WhoopDB.process_dataframe building row dicts from column arrays, and the column arrays zipped into page-sized batches of tuples
+that WhoopDB.upsert_values feeds to execute_values.
+
+Run with: PYTHONPATH=src python benchmarks/bench_process_dataframe.py [rows]
+"""
+import sys
+from itertools import islice
+import pandas as pd
+from whoop_pipeline.config import settings
+from whoop_pipeline.database import WhoopDB
+from whoop_pipeline.models import Cycle
+from common import best_of, make_cycles, peak_memory_mb
+
+
+def baseline_row_dicts(db:WhoopDB, df:pd.DataFrame, table_cols:list, batch_size:int):
+    """Materializes every row as a dict the way process_dataframe originally did, kept here as the baseline to compare against."""
+    rows = df[table_cols]
+    rows = rows.where(rows.notna(), None).to_dict(orient='records') # left NaN in float columns, which the upsert wrote as NaN rather than NULL
+    for start in range(0, len(rows), batch_size):
+        rows[start:start + batch_size]
+
+
+def row_dicts(db:WhoopDB, df:pd.DataFrame, table_cols:list, batch_size:int):
+    """Materializes every row as a dict with process_dataframe, as the upsert load method does before batching."""
+    rows = db.process_dataframe(df, table_cols)
+    for start in range(0, len(rows), batch_size):
+        rows[start:start + batch_size]
+
+
+def column_tuples(db:WhoopDB, df:pd.DataFrame, table_cols:list, batch_size:int):
+    """Builds the column arrays and consumes the zipped tuples one page at a time, as execute_values does for the values load method."""
+    rows = zip(*db.column_values(df, table_cols))
+    while list(islice(rows, batch_size)):
+        pass
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    db = WhoopDB()
+    table, primary_key, table_cols = db.get_model_class_data(Cycle)
+    batch_size = db.upsert_batch_size(table_cols, settings.db_upsert_batch_size)
+    df = make_cycles(rows)
+
+    assert [tuple(row.values()) for row in db.process_dataframe(df.head(100), table_cols)] == list(zip(*db.column_values(df.head(100), table_cols))) # both paths send the same values
+
+    for name, function in [('baseline row dicts', baseline_row_dicts), ('row dicts', row_dicts), ('column tuples', column_tuples)]:
+        seconds = best_of(lambda: function(db, df, table_cols, batch_size), repeats=1)
+        peak = peak_memory_mb(lambda: function(db, df, table_cols, batch_size))
+        print(f"{rows} rows, {name}: {seconds:.3f}s, peak {peak:.1f} MB")
@@ -0,0 +1,28 @@
+"""Compares the row-wise and vectorised timezone_offset conversions in WhoopDataCleaner.
+
+Run with: PYTHONPATH=src python benchmarks/bench_timezone_offset.py [rows]
+"""
+import sys
+import numpy as np
+import pandas as pd
+from whoop_pipeline.data_cleaning import WhoopDataCleaner
+from common import best_of
+
+
+def make_offsets(rows:int) -> pd.Series:
+    """Builds a column of offsets shaped like the API's, with some nulls and malformed values mixed in."""
+    rng = np.random.default_rng(42)
+    values = np.array(['+01:00', '+00:00', '-05:00', '+05:30', '-03:30', None, 'invalid'], dtype=object)
+    return pd.Series(values[rng.integers(0, len(values), rows)])
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    cleaner = WhoopDataCleaner()
+    offsets = make_offsets(rows)
+
+    assert cleaner.tz_offsets_to_minutes(offsets).equals(offsets.apply(cleaner.tz_offset_to_minutes))
+
+    row_wise = best_of(lambda: offsets.apply(cleaner.tz_offset_to_minutes))
+    vectorised = best_of(lambda: cleaner.tz_offsets_to_minutes(offsets))
+    print(f"{rows} rows: apply {row_wise:.3f}s, vectorised {vectorised:.3f}s, {row_wise / vectorised:.1f}x faster")
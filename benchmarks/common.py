@@ -0,0 +1,51 @@
+"""Helpers shared by the benchmarks: synthetic cycles from the mock server's SyntheticDataGenerator, and timing and memory measurement."""
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from whoop_pipeline.data_cleaning import WhoopDataCleaner
+from whoop_pipeline.mock_server import SyntheticDataGenerator, CYCLE_ID_BASE, MAX_PAGE_SIZE
+from whoop_pipeline.models import Cycle
+
+START_DATE = "2024-01-01T00:00:00.000Z"
+END_DATE = "2025-01-01T00:00:00.000Z"
+POOL_SIZE = 1000 # distinct records generated, larger inputs repeat them so a million rows does not cost a million generated records
+
+
+def synthetic_pages(endpoint:str='cycle', records:int=POOL_SIZE) -> list:
+    """Returns the pages the API would serve for records synthetic records of an endpoint, a share of cycles unscored."""
+    generator = SyntheticDataGenerator(records=records, start=START_DATE, end=END_DATE)
+    return [generator.page(endpoint, START_DATE, END_DATE, MAX_PAGE_SIZE, str(offset)) for offset in range(0, records, MAX_PAGE_SIZE)]
+
+
+def make_raw_cycles(rows:int) -> pd.DataFrame:
+    """Builds a json_normalize'd fact_cycle DataFrame from the synthetic pages, repeated up to rows with unique ids so it can be loaded."""
+    pool = pd.json_normalize([record for page in synthetic_pages() for record in page["records"]])
+    df = pool.iloc[np.arange(rows) % len(pool)].reset_index(drop=True)
+    df['id'] = CYCLE_ID_BASE + np.arange(rows)
+    return df
+
+
+def make_cycles(rows:int) -> pd.DataFrame:
+    """Builds a cleaned fact_cycle DataFrame, as clean_data returns it."""
+    return WhoopDataCleaner().clean_data(make_raw_cycles(rows), 'cycle', Cycle)
+
+
+def best_of(function, repeats:int=3, setup=None) -> float:
+    """Returns the fastest of several timed calls, in seconds. setup, if given, runs untimed before each call and its result is passed to function."""
+    timings = []
+    for _ in range(repeats):
+        argument = setup() if setup else None
+        start_time = time.perf_counter()
+        function(argument) if setup else function()
+        timings.append(time.perf_counter() - start_time)
+    return min(timings)
+
+
+def peak_memory_mb(function) -> float:
+    """Returns the peak memory a call allocates, in MB. Tracing slows allocation down, so keep the call out of timed runs."""
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
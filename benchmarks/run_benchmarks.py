@@ -0,0 +1,169 @@
+"""End-to-end benchmark suite for the ingestion pipeline. Times each stage a page of cycles goes through on its way to Postgres, at several row counts:
+
+    paginator        WhoopDataIngestor.paginator over synthetic pages served in process, including json_normalize
+    clean_data       WhoopDataCleaner.clean_data on the normalized DataFrame
+    assertion_tests  DataValidationTests.assertion_tests on every cleaned row
+    process_dataframe  WhoopDB.process_dataframe turning the cleaned DataFrame into row dicts
+    upsert_data / upsert_values / bulk_load_data  the three load methods, each into an empty fact_cycle inside a transaction that is rolled back
+
+The load benchmarks empty fact_cycle, so they run against a dedicated Postgres database at the BENCHMARK_DB_URL environment variable, never
+db_url (the upserts use Postgres' ON CONFLICT, so SQLite cannot stand in), and are skipped when it is unset or cannot be reached. Results are
+written to benchmarks/results/<git sha>.json, with -dirty appended for uncommitted trees, so runs on two commits can be compared.
+
+Run with: BENCHMARK_DB_URL=<url> PYTHONPATH=src python benchmarks/run_benchmarks.py [rows ...]  (default 1000 100000 1000000)
+Compare:  PYTHONPATH=src python benchmarks/run_benchmarks.py compare <base sha> [<head sha>]  (head defaults to the current tree)
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from whoop_pipeline.data_cleaning import WhoopDataCleaner
+from whoop_pipeline.database import WhoopDB
+from whoop_pipeline.ingest_data import WhoopDataIngestor
+from whoop_pipeline.mock_server import CYCLE_ID_BASE, MAX_PAGE_SIZE
+from whoop_pipeline.models import Cycle
+from whoop_pipeline.test_data_quality import DataValidationTests
+from common import START_DATE, END_DATE, best_of, synthetic_pages
+
+BENCHMARK_DB_URL = os.environ.get("BENCHMARK_DB_URL")
+NO_DATABASE_URL = "postgresql://" # engine of the WhoopDB used only for its in-memory stages when BENCHMARK_DB_URL is unset, it never connects
+RESULTS_PATH = Path(__file__).resolve().parent / "results"
+DEFAULT_ROWS = [1_000, 100_000, 1_000_000]
+REGRESSION_THRESHOLD = 0.10 # slowdowns beyond this share are reported as regressions by compare
+
+
+class RepeatingPageSource():
+    def __init__(self, pages:list, rows:int):
+        """Serves rows records by cycling through a fixed set of pages, so paging through a million records costs no record generation or network time."""
+        self.pages = pages
+        self.rows = rows
+
+    def get_json(self, endpoint:str, params:dict) -> dict:
+        offset = int(params.get('nextToken') or 0)
+        records = self.pages[(offset // MAX_PAGE_SIZE) % len(self.pages)]["records"][:self.rows - offset]
+        next_token = str(offset + len(records)) if offset + len(records) < self.rows else None
+        return {"records": records, "next_token": next_token}
+
+
+def git_sha() -> str:
+    """Returns the short sha of HEAD, with -dirty appended when the tree has uncommitted changes."""
+    sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    dirty = subprocess.run(["git", "diff", "--quiet", "HEAD", "--", "src", "benchmarks"]).returncode != 0
+    return f"{sha}-dirty" if dirty else sha
+
+
+def database_available(db:WhoopDB) -> bool:
+    """Checks the benchmark database is configured and can be reached, and creates the tables if needed."""
+    if not BENCHMARK_DB_URL:
+        print("Skipping the load benchmarks, BENCHMARK_DB_URL is not set")
+        return False
+    try:
+        with db.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except OperationalError as e:
+        print(f"Skipping the load benchmarks, the database cannot be reached: {e.orig}")
+        return False
+    db.create_tables()
+    return True
+
+
+def measure_load(db:WhoopDB, load, repeats:int=3) -> float:
+    """Returns the fastest of several timed loads in seconds. Each runs in its own session against an emptied fact_cycle, as in a first backfill,
+    and is rolled back so every repeat starts from the same table."""
+    timings = []
+    for _ in range(repeats):
+        session = db.SessionLocal()
+        try:
+            session.execute(text(f"DELETE FROM {Cycle.__tablename__}"))
+            start_time = time.perf_counter()
+            load(session)
+            timings.append(time.perf_counter() - start_time)
+        finally:
+            session.rollback()
+            session.close()
+    return min(timings)
+
+
+def run_benchmarks(row_counts:list) -> dict:
+    """Runs every benchmark at each row count and returns {benchmark: {rows: seconds}}."""
+    pages = synthetic_pages('cycle')
+    cleaner = WhoopDataCleaner()
+    validator = DataValidationTests()
+    db = WhoopDB(BENCHMARK_DB_URL or NO_DATABASE_URL)
+    table, primary_key, table_cols = db.get_model_class_data(Cycle)
+    with_database = database_available(db)
+
+    results = {}
+    for rows in row_counts:
+        repeats = 3 if rows <= 100_000 else 1
+        source = RepeatingPageSource(pages, rows)
+        ingestor = WhoopDataIngestor(access_token="benchmark", page_source=source)
+        first_page = source.get_json('cycle', {})
+
+        timings = {'paginator': best_of(lambda: ingestor.paginator(first_page, 'cycle', MAX_PAGE_SIZE, START_DATE, END_DATE), repeats=repeats)}
+        raw_df = ingestor.paginator(first_page, 'cycle', MAX_PAGE_SIZE, START_DATE, END_DATE)
+        raw_df['id'] = CYCLE_ID_BASE + np.arange(rows) # the repeated pages share ids, the loads need them unique
+
+        timings['clean_data'] = best_of(lambda df: cleaner.clean_data(df, 'cycle', Cycle), setup=raw_df.copy, repeats=repeats) # clean_data renames columns in place
+        df = cleaner.clean_data(raw_df.copy(), 'cycle', Cycle)
+        timings['assertion_tests'] = best_of(lambda: validator.assertion_tests(df, Cycle), repeats=repeats)
+        timings['process_dataframe'] = best_of(lambda: db.process_dataframe(df, table_cols), repeats=repeats)
+
+        if with_database:
+            row_dicts = db.process_dataframe(df, table_cols)
+            loads = {'upsert_data': lambda session: db.upsert_data(table, primary_key, table_cols, row_dicts, session=session),
+                     'upsert_values': lambda session: db.upsert_values(table, primary_key, table_cols, df, session=session),
+                     'bulk_load_data': lambda session: db.bulk_load_data(table, primary_key, table_cols, df, session=session)}
+            for name, load in loads.items():
+                timings[name] = measure_load(db, load, repeats)
+
+        for name, seconds in timings.items():
+            results.setdefault(name, {})[str(rows)] = round(seconds, 4)
+            print(f"{name:>18} {rows:>9} rows: {seconds:8.3f}s, {rows / seconds:12,.0f} rows/s")
+    return results
+
+
+def save_results(results:dict) -> Path:
+    """Writes a run's results to benchmarks/results/<git sha>.json, merging with earlier runs of the same commit so row counts can be run separately."""
+    sha = git_sha()
+    path = RESULTS_PATH / f"{sha}.json"
+    RESULTS_PATH.mkdir(exist_ok=True)
+    previous = json.loads(path.read_text())["results"] if path.exists() else {}
+    for name, timings in results.items():
+        previous.setdefault(name, {}).update(timings)
+    path.write_text(json.dumps({"sha": sha, "recorded_at": pd.Timestamp.now(tz='UTC').isoformat(), "python": platform.python_version(),
+                                "pandas": pd.__version__, "results": previous}, indent=2))
+    return path
+
+
+def compare(base_sha:str, head_sha:str) -> bool:
+    """Prints the change in every benchmark between two stored runs. Returns False if any slowed down by more than REGRESSION_THRESHOLD."""
+    base, head = [json.loads((RESULTS_PATH / f"{sha}.json").read_text())["results"] for sha in (base_sha, head_sha)]
+    regressions = 0
+    print(f"{'benchmark':>18} {'rows':>9} {base_sha:>12} {head_sha:>12} {'change':>8}")
+    for name, timings in head.items():
+        for rows, seconds in timings.items():
+            if rows not in base.get(name, {}):
+                continue
+            change = seconds / base[name][rows] - 1
+            regressed = change > REGRESSION_THRESHOLD
+            regressions += regressed
+            print(f"{name:>18} {rows:>9} {base[name][rows]:11.4f}s {seconds:11.4f}s {change:+8.1%}{'  regression' if regressed else ''}")
+    return regressions == 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        head_sha = sys.argv[3] if len(sys.argv) > 3 else git_sha()
+        sys.exit(0 if compare(sys.argv[2], head_sha) else 1)
+
+    row_counts = [int(rows) for rows in sys.argv[1:]] or DEFAULT_ROWS
+    path = save_results(run_benchmarks(row_counts))
+    print(f"Results written to {path}")
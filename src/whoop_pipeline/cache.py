@@ -0,0 +1,104 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+
+class RawPageCache():
+    def __init__(self, directory:str, ttl_seconds:float=86400, max_bytes:int=512 * 1024 * 1024):
+        """On-disk cache of raw API pages, one gzip compressed JSON file per page. Pages older than ttl_seconds are fetched again, and the least
+        recently used pages are evicted once the cache grows beyond max_bytes."""
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.size_bytes = None # worked out on the first write, then kept up to date
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, endpoint:str, params:dict) -> str:
+        """Returns the cache key of a page: a hash of the endpoint, window, page size and page token."""
+        page = {'endpoint': endpoint, 'start': params.get('start'), 'end': params.get('end'),
+                'limit': params.get('limit'), 'nextToken': params.get('nextToken')}
+        return hashlib.sha256(json.dumps(page, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key:str) -> Path:
+        """Returns the file a page is cached in."""
+        return self.directory / f"{key}.json.gz"
+
+    def get(self, endpoint:str, params:dict, ignore_ttl:bool=False):
+        """Returns the cached page for a request, or None if it was never cached or has expired. Expired pages are returned when ignore_ttl is True."""
+        path = self.path(self.key(endpoint, params))
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, EOFError, OSError, ValueError): # missing, or a partial file from an interrupted run
+            with self.lock:
+                self.misses += 1
+            return None
+
+        if not ignore_ttl and time.time() - entry['fetched_at'] > self.ttl_seconds:
+            self.remove(path)
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock: # touched under the lock so evict cannot remove the page in between
+            try:
+                os.utime(path) # marks the page as recently used for eviction
+            except OSError: # evicted since it was read, e.g. by another worker sharing the directory
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry['page']
+
+    def put(self, endpoint:str, params:dict, page:dict):
+        """Caches a page. The file is written under a temporary name and renamed, so concurrent readers never see a partial page."""
+        path = self.path(self.key(endpoint, params))
+        entry = {'endpoint': endpoint, 'params': params, 'fetched_at': time.time(), 'page': page}
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f, gzip.GzipFile(fileobj=f, mode='wb') as gz:
+            gz.write(json.dumps(entry).encode('utf-8'))
+        previous_size = path.stat().st_size if path.exists() else 0
+        os.replace(temp_path, path)
+
+        with self.lock:
+            if self.size_bytes is None:
+                self.size_bytes = sum(p.stat().st_size for p in self.directory.glob('*.json.gz'))
+            else:
+                self.size_bytes += path.stat().st_size - previous_size
+            if self.size_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Removes the least recently used pages until the cache is back under 90% of max_bytes. Called with the lock held."""
+        pages = sorted(((p.stat().st_mtime, p.stat().st_size, p) for p in self.directory.glob('*.json.gz')), key=lambda page: page[0])
+        for _, size, path in pages:
+            if self.size_bytes <= self.max_bytes * 0.9: # headroom so the next few writes do not evict again
+                break
+            path.unlink(missing_ok=True)
+            self.size_bytes -= size
+            self.evictions += 1
+
+    def remove(self, path:Path):
+        """Removes an expired page."""
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        with self.lock:
+            if self.size_bytes is not None:
+                self.size_bytes -= size
+
+    def metrics(self) -> dict:
+        """Returns the cache hits, misses and evictions so far."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -12,12 +12,37 @@ class Settings(BaseSettings):
     whoop_client_secret: str
     whoop_api_base_url: str
     db_url: str
+    db_upsert_batch_size: int = 1000 # rows sent to Postgres per upsert statement
+    db_pool_size: int = 5
+    db_pool_pre_ping: bool = True # checks connections are alive before use
+    db_atomic_runs: bool = False # load every table in one transaction, all-or-nothing
+    db_load_method: str = "upsert" # upsert, values (execute_values from column arrays), or copy to bulk load through a staging table
+    db_validate_in_database: bool = False # with the copy load method, validate staged rows with SQL before merging instead of in pandas
     whoop_refresh_token: Optional[str] = None
     whoop_redirect_uri: str
     whoop_auth_url: str
     whoop_token_url: str
     whoop_scope: str
     whoop_api_cycles_base_url: str
+    whoop_max_workers: int = 4 # threads used to fetch endpoints concurrently
+    whoop_max_connections: int = 4 # pooled keep-alive connections per WHOOP host
+    whoop_requests_per_minute: float = 100 # shared across all endpoint fetches, WHOOP allows 100 requests per minute
+    whoop_request_timeout_seconds: float = 30
+    whoop_max_retries: int = 5 # retries for 429, 5xx and connection errors before the run fails
+    whoop_backoff_base_seconds: float = 1.0
+    whoop_backoff_max_seconds: float = 60.0
+    whoop_cache_dir: Optional[str] = None # directory of the raw page cache, pages are always fetched from the API when unset
+    whoop_cache_ttl_seconds: float = 86400 # cached pages older than this are fetched again
+    whoop_cache_max_bytes: int = 512 * 1024 * 1024 # least recently used pages are evicted beyond this size
+    whoop_parse_method: str = "normalize" # normalize (json_normalize then clean_data) or direct (schema-driven RecordParser)
+    whoop_dtype_backend: str = "numpy" # numpy, or pyarrow to clean and load with Arrow-backed columns (requires pyarrow)
+    whoop_validation_mode: str = "raise" # raise to fail the load on any invalid record, or quarantine to load valid records and set the rest aside
+    whoop_pages_per_chunk: int = 20 # pages cleaned and upserted together when streaming an endpoint
+    whoop_max_buffered_chunks: int = 2 # chunks each endpoint may hold in memory while waiting to be loaded
+    whoop_watermark_lookback_hours: int = 48 # how far before an endpoint's updated_at watermark incremental runs start fetching, covers records scored or re-scored up to 2 days after they start. 168 restores the old 7 day overlap at the cost of re-fetching a week every run
+    whoop_backfill_window: str = "month" # size of the date windows crawled in parallel during a backfill, month or week
+    whoop_backfill_max_pending_windows: int = 8 # windows fetched ahead of the one loading during a backfill, bounds the records held in memory
+    whoop_metrics_textfile: Optional[str] = None # Prometheus textfile the per-stage metrics of each run are written to, e.g. in node_exporter's textfile directory
 
     class Config:
         env_file = ".env"
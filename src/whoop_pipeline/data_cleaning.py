@@ -1,7 +1,14 @@
 import pandas as pd
+import numpy as np
 from sqlalchemy import Integer, BigInteger, Float, Numeric, DateTime, String, Boolean
 
+DTYPE_BACKENDS = ['numpy', 'pyarrow'] # NumPy and pandas extension dtypes, or pyarrow-backed ArrowDtype columns
+
 class WhoopDataCleaner():
+    def __init__(self, dtype_backend:str='numpy'):
+        if dtype_backend not in DTYPE_BACKENDS:
+            raise ValueError(f"Unsupported dtype backend '{dtype_backend}', expected one of {DTYPE_BACKENDS}")
+        self.dtype_backend = dtype_backend
     
     def classify_sqla_type(self, col_type):
         """Classifies SQLAlchemy column types into simple categories."""
@@ -29,6 +36,7 @@ class WhoopDataCleaner():
     
     def split_column_names(self, df:pd.DataFrame, endpoint:str) -> pd.DataFrame:
         """Splits column names on '.' and keeps the last part."""
+        df.columns = df.columns.astype(str) # a page without records has an empty RangeIndex rather than string column names
         if endpoint == 'activity/sleep':
             df.columns = df.columns.str.replace('sleep_needed.', 'sleep_needed_', regex=False) # specific to sleep_needed columns
 
@@ -82,6 +90,13 @@ class WhoopDataCleaner():
                 return 0
         else:
             return 0
+
+    def tz_offsets_to_minutes(self, offsets:pd.Series) -> pd.Series:
+        """Converts a whole column of '+HH:MM' offsets to minutes in one pass. Each distinct value is parsed once with tz_offset_to_minutes
+        and mapped back onto the rows with a NumPy take, so nulls and malformed values give 0 exactly as the row-wise version does."""
+        codes, uniques = pd.factorize(offsets) # a handful of distinct offsets however many rows there are
+        minutes = np.array([self.tz_offset_to_minutes(offset) for offset in uniques] + [0], dtype='int64') # nulls get code -1, which picks the trailing 0
+        return pd.Series(minutes[codes], index=offsets.index, name=offsets.name)
         
     def rename_id_column(self, df:pd.DataFrame, endpoint:str) -> pd.DataFrame:
         """Renames 'id' column to '{endpoint}_id'."""
@@ -89,25 +104,89 @@ class WhoopDataCleaner():
             df = df.rename(columns={'id': f"{endpoint.split('/')[-1]}_id"}) # gets last part of endpoint for id renaming
         return df
     
+    def add_missing_columns(self, df:pd.DataFrame, model_class) -> pd.DataFrame:
+        """Adds any model column missing from the DataFrame as nulls, e.g. score columns absent from a page of unscored records."""
+        missing_columns = [col.name for col in model_class.__table__.columns if col.name not in df.columns]
+        if missing_columns:
+            df = df.reindex(columns=list(df.columns) + missing_columns)
+        return df
+
+    def arrow_coerce_functions(self) -> dict:
+        """Returns the conversions to pyarrow-backed dtypes. Nulls stay nulls, so strings never become the literal 'None', except in boolean
+        columns, which are coerced with astype(bool) as in the numpy backend so a missing score.user_calibrating is not NULL in a NOT NULL column."""
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("The pyarrow dtype backend requires pyarrow, install it with 'pip install pyarrow'") from e
+
+        return {'datetime': lambda s: pd.to_datetime(s, errors='coerce', utc=True).astype(pd.ArrowDtype(pa.timestamp('ns', tz='UTC'))),
+                'integer': lambda s: pd.to_numeric(s, errors='coerce').astype(pd.ArrowDtype(pa.int64())),
+                'float': lambda s: pd.to_numeric(s, errors='coerce').astype(pd.ArrowDtype(pa.float64())),
+                'string': lambda s: s.astype(pd.ArrowDtype(pa.string())),
+                'boolean': lambda s: s.astype(bool).astype(pd.ArrowDtype(pa.bool_()))}
+
+    def get_cleaning_plan(self, endpoint:str, model_class) -> "CleaningPlan":
+        """Returns the cleaning plan for an endpoint's model, compiling it on first use. Plans are shared by every cleaner in the process."""
+        key = (endpoint, model_class, self.dtype_backend)
+        if key not in CLEANING_PLANS:
+            CLEANING_PLANS[key] = CleaningPlan(self, endpoint, model_class)
+        return CLEANING_PLANS[key]
+
     def clean_data(self, df:pd.DataFrame, endpoint:str, model_class) -> pd.DataFrame:
         """Cleans data based on the specified data type."""        
 
-        if 'timezone_offset' in df.columns:
-            df['timezone_offset'] = df['timezone_offset'].apply(self.tz_offset_to_minutes)
+        plan = self.get_cleaning_plan(endpoint, model_class)
 
-        df = self.split_column_names(df, endpoint)
-        df = self.rename_id_column(df, endpoint) 
-        
-        col_types = self.columns_by_type(model_class)
+        if 'timezone_offset' in df.columns:
+            df['timezone_offset'] = self.tz_offsets_to_minutes(df['timezone_offset'])
 
-        df = self.coerce_datetime(df, col_types['datetime'])
-        df = self.coerce_integer(df, col_types['integer'])
-        df = self.coerce_float(df, col_types['float'])
-        df = self.coerce_string(df, col_types['string'])
-        df = self.coerce_boolean(df, col_types['boolean'])
+        df.columns = plan.renamed_columns(df.columns)
+        df = self.add_missing_columns(df, model_class)
+        df = plan.coerce(df)
 
         return df
-    
+
+
+class CleaningPlan():
+    def __init__(self, cleaner:WhoopDataCleaner, endpoint:str, model_class):
+        """Compiles everything clean_data needs to know about a model once: the target type of each column and, per set of
+        json_normalize column names, the model column names they are renamed to."""
+        self.cleaner = cleaner
+        self.endpoint = endpoint
+        self.converters = {} # model column name -> function converting a Series to the column's type
+        coerce_functions = {'datetime': lambda s: pd.to_datetime(s, errors='coerce'),
+                            'integer': lambda s: pd.to_numeric(s, errors='coerce').astype('Int64'),
+                            'float': lambda s: pd.to_numeric(s, errors='coerce').astype(float),
+                            'string': lambda s: s.astype(str),
+                            'boolean': lambda s: s.astype(bool)} # same conversions as the coerce_* methods
+        if cleaner.dtype_backend == 'pyarrow':
+            coerce_functions = cleaner.arrow_coerce_functions()
+        for col_type, columns in cleaner.columns_by_type(model_class).items():
+            for col in columns:
+                if col_type in coerce_functions:
+                    self.converters[col] = coerce_functions[col_type]
+        self.renamed = {} # tuple of input column names -> renamed column names
+
+    def renamed_columns(self, columns:pd.Index) -> list:
+        """Returns the model column names for a set of json_normalize column names, working them out with split_column_names
+        and rename_id_column the first time the set is seen."""
+        key = tuple(columns)
+        if key not in self.renamed:
+            df = pd.DataFrame(columns=columns) # an empty frame, only the column names are renamed
+            df = self.cleaner.split_column_names(df, self.endpoint)
+            df = self.cleaner.rename_id_column(df, self.endpoint)
+            self.renamed[key] = list(df.columns)
+        return self.renamed[key]
+
+    def coerce(self, df:pd.DataFrame) -> pd.DataFrame:
+        """Converts every model column present in the DataFrame to its target type in a single pass."""
+        converted = {col: convert(df[col]) for col, convert in self.converters.items() if col in df.columns}
+        return df.assign(**converted)
+
+
+CLEANING_PLANS = {} # (endpoint, model class, dtype backend) -> CleaningPlan
+
+
 if __name__ == '__main__':
     cleaner = WhoopDataCleaner()
     schema = cleaner.classify_sqla_type('workout')
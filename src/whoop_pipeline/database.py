@@ -1,25 +1,61 @@
 from sqlalchemy import create_engine, MetaData, Table
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import insert
-from whoop_pipeline.models import Base, Sleep, Recovery, Cycle, Workout
+from whoop_pipeline.models import Base, Sleep, Recovery, Cycle, Workout, CrawlCheckpoint, EndpointWatermark, QuarantinedRecord
 from sqlalchemy.orm import sessionmaker
 from whoop_pipeline.config import settings 
 import os
+import io
+import json
 import pandas as pd
 import datetime as dt
-from typing import Dict, List
+from typing import Dict, List, Optional
 import psycopg2
-from sqlalchemy import text
+from psycopg2.extras import execute_values
+from sqlalchemy import text, func, or_, literal_column, select, DateTime, table as sql_table, column as sql_column
 import time
+from contextlib import contextmanager
 from datetime import date, timedelta, datetime as dt
 
+POSTGRES_MAX_BIND_PARAMETERS = 65535
+
 class WhoopDB():
-    def __init__(self):
-        self.db_url = settings.db_url
-        self.engine = create_engine(self.db_url)
+    def __init__(self, db_url:Optional[str]=None):
+        self.db_url = db_url or settings.db_url
+        self.engine = create_engine(self.db_url,
+                                    pool_size=settings.db_pool_size, # connections kept open and reused across sessions
+                                    pool_pre_ping=settings.db_pool_pre_ping) # replaces connections dropped by the server before handing them out
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
-        self.session = self.SessionLocal()
-        self.connection = self.engine.connect()
+
+    @contextmanager
+    def unit_of_work(self):
+        """Yields a session holding one pooled connection and one transaction for a whole run. It is committed if the block succeeds and rolled back otherwise, so loads are all-or-nothing."""
+        session = self.SessionLocal()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    @contextmanager
+    def session_scope(self, session=None):
+        """Yields the session passed in, flushed at the end for its caller to commit, or else a unit of work that commits on its own."""
+        if session is not None:
+            yield session
+            session.flush()
+        else:
+            with self.unit_of_work() as session:
+                yield session
+
+    def read_sql(self, query, connection=None, params:dict=None) -> pd.DataFrame:
+        """Runs a query on the given connection, or on a pooled connection that is returned as soon as the query completes."""
+        if connection == None:
+            with self.engine.connect() as connection:
+                return pd.read_sql(query, con=connection, params=params)
+        return pd.read_sql(query, con=connection, params=params)
 
     def create_tables(self):
         """Creates database tables based on the defined models if they don't already exist."""
@@ -37,44 +73,211 @@ class WhoopDB():
         """Processes the DataFrame to match the database table schema."""
 
         df = df[table_cols] # Keep only columns that exist in the table
-        df = df.where(df.notna(), None) # Replace pandas NaN with None for SQL compatibility
-        rows = df.to_dict(orient='records') # Convert DataFrame to list of dictionaries for upserting to database
+        # built from the same column arrays as the values and copy load methods, so NaN in float columns is NULL whichever method loads a table
+        return [dict(zip(table_cols, row)) for row in zip(*self.column_values(df, table_cols))]
 
-        return rows
+    def column_values(self, df:pd.DataFrame, table_cols:list) -> list:
+        """Returns one object array per table column holding Python values, with NaN, NaT and NA as None so the driver writes them as NULL."""
+        values = []
+        for col in table_cols:
+            series = df[col]
+            if series.dtype.kind == 'M':
+                column = pd.DatetimeIndex(series).to_pydatetime() # datetime objects, far cheaper to build than a Timestamp per value
+                column[series.isna().to_numpy()] = None
+            else:
+                column = series.to_numpy(dtype=object, na_value=None)
+            values.append(column)
+        return values
 
-    def upsert_data(self, table, primary_key:list, table_cols:list, rows:dict, session=None):
-        """Upserts data into the specified table. Checks for existing records based on primary key(s) and updates them if they exist, otherwise inserts new records."""
+    def upsert_data(self, table, primary_key:list, table_cols:list, rows:dict, session=None, skip_unchanged:bool=True, batch_size:int=None):
+        """Upserts rows into the table in batches of batch_size, only rewriting existing records that changed when skip_unchanged is True.
+        Returns inserted, updated and unchanged counts, or None if the upsert failed. Errors are raised instead when a session is passed in."""
 
         if not rows:
-            return None  # nothing matches table columns
+            return {"inserted": 0, "updated": 0, "unchanged": 0}  # nothing matches table columns
+        if isinstance(rows, dict):
+            rows = [rows] # a single record
         
         table_name = table.name
 
-        statement = insert(table).values(rows) # Create an insert statement with the data
+        statement = insert(table) # Rows are bound per batch with executemany rather than rendered into one VALUES clause
         
         updatable = [c for c in table_cols if c not in primary_key] # All columns except primary keys as that will remain the same
         
         # Create the upsert statement. This replaces any existing data records with the new data or just adds them should they not already exist. Effectively Updating or Inserting.
         upsert_statement = statement.on_conflict_do_update(
             index_elements= primary_key, # Primary Key Column name
-            set_={c: statement.excluded[c] for c in updatable} # Updates all columns from rows except primary key
+            set_={c: statement.excluded[c] for c in updatable}, # Updates all columns from rows except primary key
+            where=self.changed_condition(table, statement, updatable) if skip_unchanged else None # Skips rows identical to the stored record
         )
+        upsert_statement = upsert_statement.returning(literal_column("xmax = 0").label("inserted")) # xmax is 0 for freshly inserted rows, unchanged rows are not returned
+        batch_size = self.upsert_batch_size(table_cols, batch_size)
+        upsert_statement = upsert_statement.execution_options(insertmanyvalues_page_size=batch_size)
         
-        class_session = False
-        if session == None:
-            session = self.SessionLocal()
-            class_session = True
+        try:
+            with self.session_scope(session) as load_session:
+                inserted_flags = []
+                for start in range(0, len(rows), batch_size):
+                    inserted_flags.extend(load_session.execute(upsert_statement, rows[start:start + batch_size]).scalars().all())
+        except Exception as e:
+            print(f"Error upserting data into {table_name}: {e}")
+            if session is not None:
+                raise # the caller's unit of work decides whether to roll back
+            return None
+
+        inserted = sum(inserted_flags)
+        counts = {"inserted": inserted, "updated": len(inserted_flags) - inserted, "unchanged": len(rows) - len(inserted_flags)}
+        print(f"Upserted {len(rows)} records into {table_name}: {counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged.")
+        return counts
+
+    def upsert_values(self, table, primary_key:list, table_cols:list, df:pd.DataFrame, session=None, skip_unchanged:bool=True, batch_size:int=None):
+        """Upserts a cleaned DataFrame with execute_values, fed tuples zipped from column_values instead of row dicts. Returns the same counts as upsert_data."""
+
+        if df.empty:
+            return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        table_name = table.name
+        updatable = [c for c in table_cols if c not in primary_key]
+        column_list = ", ".join(f'"{c}"' for c in table_cols)
+        key_list = ", ".join(f'"{c}"' for c in primary_key)
+        update_list = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in updatable)
+        upsert_sql = f"INSERT INTO {table_name} ({column_list}) VALUES %s ON CONFLICT ({key_list}) DO UPDATE SET {update_list}"
+        if skip_unchanged:
+            upsert_sql += " WHERE " + " OR ".join(f'{table_name}."{c}" IS DISTINCT FROM EXCLUDED."{c}"' for c in updatable) # same guard as changed_condition
+        upsert_sql += " RETURNING xmax = 0" # xmax is 0 for freshly inserted rows, unchanged rows are not returned
+        batch_size = self.upsert_batch_size(table_cols, batch_size)
 
         try:
-            session.execute(upsert_statement)
-            if class_session == True:
-                session.commit()
-            else: session.flush()
-            print(f"Upserted {len(rows)} records into {table_name}.")
+            with self.session_scope(session) as load_session:
+                cursor = load_session.connection().connection.driver_connection.cursor() # execute_values needs the raw psycopg2 cursor, on the same connection as the session
+                try:
+                    rows = zip(*self.column_values(df, table_cols)) # tuples are only built for the page being sent
+                    inserted_flags = [row[0] for row in execute_values(cursor, upsert_sql, rows, page_size=batch_size, fetch=True)]
+                finally:
+                    cursor.close()
         except Exception as e:
-            if class_session == True:
-                session.rollback()
             print(f"Error upserting data into {table_name}: {e}")
+            if session is not None:
+                raise # the caller's unit of work decides whether to roll back
+            return None
+
+        inserted = sum(inserted_flags)
+        counts = {"inserted": inserted, "updated": len(inserted_flags) - inserted, "unchanged": len(df) - len(inserted_flags)}
+        print(f"Upserted {len(df)} records into {table_name}: {counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged.")
+        return counts
+
+    def bulk_load_data(self, table, primary_key:list, table_cols:list, df:pd.DataFrame, session=None, skip_unchanged:bool=True, batch_size:int=None,
+                       validate=None):
+        """Bulk loads a cleaned DataFrame with COPY into a staging table merged into the table in one statement. Returns the same counts as upsert_data.
+        validate, if given, is called with the connection and staging table name before the merge and returns the number of staged rows it removed, failed validations are always raised."""
+
+        if df.empty:
+            return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+        table_name = table.name
+        staging_name = f"staging_{table_name}"
+        batch_size = batch_size or settings.db_upsert_batch_size
+
+        try:
+            with self.session_scope(session) as load_session:
+                connection = load_session.connection()
+                self.create_staging_table(connection, table, staging_name)
+                self.copy_dataframe(connection, staging_name, df[table_cols], batch_size)
+                removed = validate(connection, staging_name) if validate else 0
+
+                staging_table = sql_table(staging_name, *[sql_column(c) for c in table_cols])
+                statement = insert(table).from_select(table_cols, select(*[staging_table.c[c] for c in table_cols]))
+                updatable = [c for c in table_cols if c not in primary_key]
+                upsert_statement = statement.on_conflict_do_update(
+                    index_elements= primary_key,
+                    set_={c: statement.excluded[c] for c in updatable},
+                    where=self.changed_condition(table, statement, updatable) if skip_unchanged else None
+                ).returning(literal_column("xmax = 0").label("inserted"))
+
+                inserted_flags = connection.execute(upsert_statement).scalars().all()
+                connection.execute(text(f"DROP TABLE {staging_name}"))
+        except Exception as e:
+            print(f"Error bulk loading data into {table_name}: {e}")
+            if session is not None or isinstance(e, AssertionError):
+                raise # the caller's unit of work decides whether to roll back, and failed validation stops the load as it does in pandas
+            return None
+
+        inserted, merged = sum(inserted_flags), len(df) - removed # rows removed by validation never reach the table
+        counts = {"inserted": inserted, "updated": len(inserted_flags) - inserted, "unchanged": merged - len(inserted_flags)}
+        print(f"Bulk loaded {merged} records into {table_name}: {counts['inserted']} inserted, {counts['updated']} updated, {counts['unchanged']} unchanged.")
+        return counts
+
+    def create_staging_table(self, connection, table, staging_name:str):
+        """Creates a temporary staging table shaped like the target table. Temporary tables are not WAL logged and are dropped at the end of the transaction."""
+        connection.execute(text(f"CREATE TEMP TABLE {staging_name} (LIKE {table.name}) ON COMMIT DROP"))
+        # LIKE copies NOT NULL constraints, dropped so rows breaking them can be staged and validated, the merge still enforces them
+        not_null_columns = [col.name for col in table.columns if not col.nullable and not col.primary_key]
+        if not_null_columns:
+            connection.execute(text(f"ALTER TABLE {staging_name} " + ", ".join(f'ALTER COLUMN "{c}" DROP NOT NULL' for c in not_null_columns)))
+        for col in table.columns:
+            if isinstance(col.type, DateTime):
+                # staged as timestamptz so offsets are converted to the session time zone exactly as psycopg2 does for the row-dict upsert
+                connection.execute(text(f'ALTER TABLE {staging_name} ALTER COLUMN "{col.name}" TYPE TIMESTAMPTZ'))
+
+    def validate_staging(self, connection, staging_name:str, endpoint:str, rule_set, validation_mode:str='raise') -> int:
+        """Runs a model's validation rules as SQL over a staging table. Raise mode raises an AssertionError with the failures per rule,
+        quarantine mode moves failing rows to quarantined_records. Returns the number of rows removed from the staging table."""
+        pk = rule_set.pk_column_name
+        checked = (f'SELECT s.*, s.ctid AS row_ctid, row_number() OVER (PARTITION BY "{pk}" ORDER BY s.ctid) AS pk_occurrence '
+                   f'FROM {staging_name} s') # ctid follows COPY order, so the first of rows sharing a key passes as in pandas
+
+        if validation_mode == 'raise':
+            counts = ", ".join(f'COUNT(*) FILTER (WHERE {condition}) AS "{rule}"' for rule, condition in rule_set.sql_conditions.items())
+            failures = connection.execute(text(f"SELECT {counts} FROM ({checked}) checked")).mappings().one() # one scan for every rule
+            failures = {rule: count for rule, count in failures.items() if count}
+            if failures:
+                raise AssertionError(f"Staged {staging_name} rows failed validation: {failures}")
+            return 0
+
+        failed_rules = ", ".join(f"CASE WHEN {condition} THEN '{rule}' END" for rule, condition in rule_set.sql_conditions.items())
+        any_failed = " OR ".join(f"({condition})" for condition in rule_set.sql_conditions.values())
+        result = connection.execute(text(
+            f"WITH failed AS ("
+            f"  SELECT row_ctid, \"{pk}\"::text AS record_key, concat_ws(',', {failed_rules}) AS failed_rules,"
+            f"         to_jsonb(checked) - 'row_ctid' - 'pk_occurrence' AS record"
+            f"  FROM ({checked}) checked WHERE {any_failed})," # records are only turned into JSON once they are known to fail
+            f" removed AS (DELETE FROM {staging_name} WHERE ctid IN (SELECT row_ctid FROM failed) RETURNING 1),"
+            f" quarantined AS (INSERT INTO {QuarantinedRecord.__tablename__} (endpoint, record_key, failed_rules, record, quarantined_at)"
+            f"  SELECT :endpoint, record_key, failed_rules, record, now() FROM failed"
+            f"  ON CONFLICT (endpoint, record_key, failed_rules) DO NOTHING)"
+            f" SELECT count(*) FROM removed"), {"endpoint": endpoint}) # every data-modifying CTE runs, referenced or not
+        removed = result.scalar()
+        if removed:
+            print(f"Quarantined {removed} staged records for {endpoint} that failed validation.")
+        return removed
+
+    def staged_max(self, connection, staging_name:str, column:str):
+        """Returns the highest value of a staging table column as a UTC Timestamp, or None if it holds no rows."""
+        value = connection.execute(text(f'SELECT max("{column}") FROM {staging_name}')).scalar()
+        return None if value is None else pd.Timestamp(value).tz_convert('UTC')
+
+    def copy_dataframe(self, connection, staging_name:str, df:pd.DataFrame, batch_size:int):
+        """Streams a DataFrame into a table with COPY FROM STDIN, writing batch_size rows of CSV at a time to keep the buffer small."""
+        column_list = ", ".join(f'"{c}"' for c in df.columns)
+        copy_sql = f"COPY {staging_name} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        cursor = connection.connection.driver_connection.cursor() # COPY needs the raw psycopg2 cursor, on the same connection as the session
+        try:
+            for start in range(0, len(df), batch_size):
+                buffer = io.StringIO()
+                df.iloc[start:start + batch_size].to_csv(buffer, index=False, header=False, na_rep="\\N")
+                buffer.seek(0)
+                cursor.copy_expert(copy_sql, buffer)
+        finally:
+            cursor.close()
+
+    def upsert_batch_size(self, table_cols:list, batch_size:int=None) -> int:
+        """Returns the rows per upsert statement, capped so a batch never exceeds Postgres' limit of 65535 bind parameters."""
+        batch_size = batch_size or settings.db_upsert_batch_size
+        return max(1, min(batch_size, POSTGRES_MAX_BIND_PARAMETERS // len(table_cols)))
+
+    def changed_condition(self, table, statement, columns:list):
+        """Builds the condition that an existing row differs from the incoming one in at least one column. IS DISTINCT FROM treats two NULLs as equal."""
+        return or_(*[table.c[c].is_distinct_from(statement.excluded[c]) for c in columns])
 
     def get_access_token_table(self):
         """Creates the access_tokens table if it doesn't exist."""
@@ -95,40 +298,110 @@ class WhoopDB():
             index_elements= ['provider'], # Primary Key Column name
             set_={c: statement.excluded[c] for c in updatable} # Updates all columns except primary key
         )
-        class_session = False
-        if session == None:
-            session = self.SessionLocal()
-            class_session = True
-
         try:
-            session.execute(upsert_statement)
-            if class_session == True:
-                session.commit()
-            else: session.flush()
+            self.execute_statement(upsert_statement, session)
             print(f"Upserted 1 record into {'access_tokens'}.")
         except Exception as e:
-            if class_session == True:
-                session.rollback()
             print(f"Error upserting 1 record into {'access_tokens'}.")
 
 
     def get_access_token(self, connection=None) -> Dict:
         """Fetches the access token from the access_tokens table."""
-        if connection == None:
-            connection = self.connection
-
-        token_data = pd.read_sql(text("SELECT * FROM ACCESS_TOKENS"), con=connection)
+        token_data = self.read_sql(text("SELECT * FROM ACCESS_TOKENS"), connection)
         
         if not token_data.empty:
             return token_data.iloc[0].to_dict() # convert first row to dict
         else:
             return {}
 
+    def get_checkpoints(self, endpoint:str, connection=None) -> List[Dict]:
+        """Fetches the unfinished crawl checkpoints for an endpoint, oldest first, each with the watermark its crawl started with as a UTC timestamp."""
+        checkpoints = self.read_sql(text("SELECT endpoint, window_start, window_end, next_token, watermark FROM crawl_checkpoints WHERE endpoint = :endpoint ORDER BY updated_at"),
+                                    connection, params={"endpoint": endpoint})
+        checkpoints = checkpoints.to_dict(orient='records')
+        for checkpoint in checkpoints:
+            checkpoint['watermark'] = pd.Timestamp(checkpoint['watermark']).tz_localize('UTC') if pd.notna(checkpoint['watermark']) else None
+        return checkpoints
+
+    def upsert_checkpoint(self, endpoint:str, window_start:str, window_end:str, next_token:str, watermark=None, max_updated_at=None, session=None):
+        """Records the token of the next page to fetch for an endpoint's window, so an interrupted crawl can resume from it.
+        The watermark the crawl started with is kept from the first checkpoint, and max_updated_at stages the highest updated_at loaded so far."""
+        checkpoint_table = CrawlCheckpoint.__table__
+        statement = insert(checkpoint_table).values(endpoint=endpoint, window_start=window_start, window_end=window_end, next_token=next_token,
+                                                     updated_at=dt.now(), watermark=self.naive_utc(watermark), max_updated_at=self.naive_utc(max_updated_at))
+        upsert_statement = statement.on_conflict_do_update(
+            index_elements=['endpoint', 'window_start', 'window_end'],
+            set_={'next_token': statement.excluded.next_token, 'updated_at': statement.excluded.updated_at,
+                  'max_updated_at': func.greatest(checkpoint_table.c.max_updated_at, statement.excluded.max_updated_at)} # greatest ignores nulls
+        )
+        self.execute_statement(upsert_statement, session)
+
+    def complete_checkpoint(self, endpoint:str, window_start:str, window_end:str, max_updated_at=None, session=None):
+        """Removes the checkpoint of a window crawled to the end and raises the endpoint's watermark to the highest updated_at the window loaded,
+        its staged max_updated_at or that of the final chunk, in one statement."""
+        statement = text(
+            "WITH completed AS ("
+            "  DELETE FROM crawl_checkpoints WHERE endpoint = :endpoint AND window_start = :window_start AND window_end = :window_end"
+            "  RETURNING max_updated_at)"
+            " INSERT INTO endpoint_watermarks (endpoint, updated_at)"
+            " SELECT :endpoint, greatest(max(max_updated_at), CAST(:max_updated_at AS TIMESTAMP)) FROM completed"
+            " HAVING greatest(max(max_updated_at), CAST(:max_updated_at AS TIMESTAMP)) IS NOT NULL"
+            " ON CONFLICT (endpoint) DO UPDATE SET updated_at = greatest(endpoint_watermarks.updated_at, excluded.updated_at)"
+        ).bindparams(endpoint=endpoint, window_start=window_start, window_end=window_end, max_updated_at=self.naive_utc(max_updated_at))
+        self.execute_statement(statement, session)
+
+    def get_watermark(self, endpoint:str, connection=None):
+        """Fetches the highest updated_at loaded for an endpoint as a UTC timestamp, or None if the endpoint has never been loaded."""
+        watermark = self.read_sql(text("SELECT updated_at FROM endpoint_watermarks WHERE endpoint = :endpoint"),
+                                  connection, params={"endpoint": endpoint})
+        if watermark.empty:
+            return None
+        return pd.Timestamp(watermark['updated_at'][0]).tz_localize('UTC')
+
+    def upsert_watermark(self, endpoint:str, updated_at, session=None):
+        """Raises an endpoint's watermark to updated_at, never moving it backwards. Only called once a whole window has loaded."""
+        watermark_table = EndpointWatermark.__table__
+        statement = insert(watermark_table).values(endpoint=endpoint, updated_at=self.naive_utc(updated_at))
+        upsert_statement = statement.on_conflict_do_update(
+            index_elements=['endpoint'],
+            set_={'updated_at': func.greatest(watermark_table.c.updated_at, statement.excluded.updated_at)}
+        )
+        self.execute_statement(upsert_statement, session)
+
+    def naive_utc(self, timestamp):
+        """Returns a timestamp as a naive UTC datetime, as watermarks are stored so the session time zone cannot shift them. None and NaT give None."""
+        if timestamp is None or pd.isna(timestamp):
+            return None
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+        return timestamp.to_pydatetime()
+
+    def quarantine_rows(self, endpoint:str, df:pd.DataFrame, primary_key:list, session=None) -> int:
+        """Writes records that failed validation to quarantined_records, with the rules they failed from the DataFrame's failed_rules column.
+        Records already quarantined for the same key and rules, e.g. by an earlier run over the same window, are not written again.
+        Returns the number of records quarantined."""
+        if df.empty:
+            return 0
+
+        records = json.loads(df.drop(columns=['failed_rules']).to_json(orient='records', date_format='iso')) # NaN, NaT and NA become JSON null
+        record_keys = df[primary_key[0]].astype(object).where(df[primary_key[0]].notna(), None)
+        quarantined_at = dt.now()
+        rows = [{'endpoint': endpoint, 'record_key': None if key is None else str(key), 'failed_rules': failed_rules,
+                 'record': record, 'quarantined_at': quarantined_at}
+                for key, failed_rules, record in zip(record_keys, df['failed_rules'], records)]
+        statement = insert(QuarantinedRecord.__table__).values(rows).on_conflict_do_nothing(index_elements=['endpoint', 'record_key', 'failed_rules'])
+        self.execute_statement(statement, session)
+        return len(rows)
+
+    def execute_statement(self, statement, session=None):
+        """Executes a statement, committing it when no session is passed in."""
+        with self.session_scope(session) as session:
+            session.execute(statement)
+
     def get_max_date(self, connection=None):
-        """Fetches the maximum created_at date from the fact_cycle table."""    
-        if connection == None:
-            connection = self.engine.connect()
-        max_date = pd.read_sql(text("SELECT MAX(created_at) as max_date FROM fact_cycle"), con=connection)
+        """Fetches the maximum created_at date from the fact_cycle table."""
+        max_date = self.read_sql(text("SELECT MAX(created_at) as max_date FROM fact_cycle"), connection)
         return max_date['max_date'][0]
     
 
@@ -1,21 +1,55 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from whoop_pipeline.config import settings
 from whoop_pipeline.auth import WhoopClient
 from whoop_pipeline.database import WhoopDB
 from whoop_pipeline.data_cleaning import WhoopDataCleaner
 from whoop_pipeline.test_data_quality import DataValidationTests
+from whoop_pipeline.rate_limiter import RateLimiter
+from whoop_pipeline.cache import RawPageCache
+from whoop_pipeline.record_parser import RecordParser
+from whoop_pipeline.metrics import PipelineMetrics
 import whoop_pipeline.models as WhoopModels
 import pandas as pd
 import time
-from datetime import date, timedelta, datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from collections import deque
+from itertools import islice
+import queue
+import threading
+import random
+from email.utils import parsedate_to_datetime
+from datetime import date, timedelta, timezone, datetime as dt
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+LOAD_METHODS = ['upsert', 'values', 'copy'] # row-dict upsert, row tuples from column arrays with execute_values, or COPY into a staging table followed by a single merge
+VALIDATION_MODES = ['raise', 'quarantine'] # fail the whole load, or write failing records to quarantined_records and load the rest
+PARSE_METHODS = ['normalize', 'direct'] # json_normalize then clean_data, or the schema-driven RecordParser
 
 class WhoopDataIngestor():
-    def __init__(self, access_token:str):
+    def __init__(self, access_token:str, max_workers:int=None, load_method:str=None, parse_method:str=None, dtype_backend:str=None, validation_mode:str=None, page_source=None):
         self.access_token = access_token
+        self.max_workers = max_workers or settings.whoop_max_workers
+        self.load_method = load_method or settings.db_load_method
+        if self.load_method not in LOAD_METHODS:
+            raise ValueError(f"Unsupported load method '{self.load_method}', expected one of {LOAD_METHODS}")
+        self.parse_method = parse_method or settings.whoop_parse_method
+        if self.parse_method not in PARSE_METHODS:
+            raise ValueError(f"Unsupported parse method '{self.parse_method}', expected one of {PARSE_METHODS}")
+        self.validation_mode = validation_mode or settings.whoop_validation_mode
+        if self.validation_mode not in VALIDATION_MODES:
+            raise ValueError(f"Unsupported validation mode '{self.validation_mode}', expected one of {VALIDATION_MODES}")
+        self.rate_limiter = RateLimiter(settings.whoop_requests_per_minute) # shared by every thread so parallel fetches stay within the API limit
+        self.metrics = PipelineMetrics() # per-stage timings of the current run
         self.base_url = settings.whoop_api_base_url
         self.cycles_base_url = settings.whoop_api_cycles_base_url
-        self.whoop_data_cleaner = WhoopDataCleaner()
+        self.http_session = self.build_http_session()
+        self.page_source = page_source # serves pages in place of the API when set, e.g. a ReplaySource
+        self.page_cache = RawPageCache(settings.whoop_cache_dir, settings.whoop_cache_ttl_seconds, settings.whoop_cache_max_bytes) if settings.whoop_cache_dir else None
+        self.dtype_backend = dtype_backend or settings.whoop_dtype_backend
+        self.whoop_data_cleaner = WhoopDataCleaner(self.dtype_backend)
         self.whoop_database = WhoopDB()
         self.data_quality_validator = DataValidationTests()
         self.model_classes = {'cycle': WhoopModels.Cycle,
@@ -23,90 +57,419 @@ class WhoopDataIngestor():
                 'recovery': WhoopModels.Recovery,
                 'activity/workout': WhoopModels.Workout
                 } # returns the table schema from models.py based on endpoint
+        self.record_parsers = {endpoint: RecordParser(endpoint, model_class, self.dtype_backend) for endpoint, model_class in self.model_classes.items()}
+        self.endpoints = {'fact_cycle': 'cycle',
+                      'fact_activity_sleep':'activity/sleep',
+                        'fact_recovery':'recovery',
+                          'fact_workout':'activity/workout'} # load order matters, fact_cycle must be loaded before the tables referencing it
+
+    def build_http_session(self) -> requests.Session:
+        """Builds a keep-alive HTTP session shared by every request the ingestor makes, so each page reuses a pooled connection instead of a new TCP+TLS handshake."""
+        http_session = requests.Session()
+        http_session.headers.update({
+            "Authorization": f"Bearer {self.access_token}"
+            , "Accept": "application/json"
+        }) # auth headers are built once rather than on every page
+        adapter = HTTPAdapter(pool_connections=2, # one pool per WHOOP host (cycles and the other endpoints)
+                              pool_maxsize=settings.whoop_max_connections, # connections kept open per host
+                              pool_block=True) # threads wait for a free connection rather than opening extra ones
+        http_session.mount("https://", adapter)
+        http_session.mount("http://", adapter)
+        return http_session
+
+    def close(self):
+        """Closes the pooled HTTP connections."""
+        self.http_session.close()
 
     def get_json(self, base_url:str, base_cycles_url:str, endpoint:str, params:dict) -> dict:
-        """Fetches JSON data from the Whoop API."""
+        """Fetches JSON data from the Whoop API, or from the raw page cache when whoop_cache_dir is set and the page was fetched recently.
+        Pages come from the page source instead when one was given. The time taken, pages, response bytes and retries are recorded as the endpoint's fetch stage."""
+        with self.metrics.stage(endpoint, 'fetch') as fetch:
+            fetch['pages'] = 1
+            return self.fetch_page(endpoint, params, fetch)
+
+    def fetch_page(self, endpoint:str, params:dict, fetch:dict) -> dict:
+        """Returns a page from the page source, the raw page cache or the API, adding the response bytes and retries to the fetch stage's counts."""
+        if self.page_source is not None:
+            return self.page_source.get_json(endpoint, params)
+
+        if self.page_cache is not None:
+            cached_page = self.page_cache.get(endpoint, params)
+            if cached_page is not None:
+                return cached_page
 
         if endpoint == 'cycle': 
             base_url = self.cycles_base_url 
         else: base_url = self.base_url
         
         url = f"{base_url}{endpoint}"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}"
-            , "Accept": "application/json"
-        }  
-        
-        response = requests.get(url, headers=headers, params=params)
-        response.raise_for_status()
-        response_json = response.json()
         
-        return response_json
+        for attempt in range(settings.whoop_max_retries + 1):
+            self.rate_limiter.wait()
+            try:
+                response = self.http_session.get(url, params=params, timeout=settings.whoop_request_timeout_seconds)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == settings.whoop_max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == settings.whoop_max_retries:
+                    response.raise_for_status()
+                    self.rate_limiter.record_success()
+                    response_json = response.json()
+                    fetch['bytes'] += len(response.content)
+                    if self.page_cache is not None:
+                        self.page_cache.put(endpoint, params, response_json)
+                    return response_json
+
+                delay = self.retry_after(response)
+                if response.status_code == 429: # the limiter pauses every thread until Retry-After has passed
+                    self.rate_limiter.record_rate_limited(delay if delay is not None else self.backoff_delay(attempt))
+                    delay = 0
+                elif delay is None:
+                    delay = self.backoff_delay(attempt)
+
+            self.rate_limiter.record_retry()
+            fetch['retries'] += 1
+            print(f"Retrying {endpoint} (attempt {attempt + 1} of {settings.whoop_max_retries})")
+            time.sleep(delay)
+
+    def backoff_delay(self, attempt:int) -> float:
+        """Returns a jittered exponential backoff delay for the given retry attempt."""
+        ceiling = min(settings.whoop_backoff_max_seconds, settings.whoop_backoff_base_seconds * 2 ** attempt)
+        return random.uniform(ceiling / 2, ceiling) # jitter stops parallel threads retrying in lockstep
+
+    def retry_after(self, response:requests.Response):
+        """Returns the number of seconds requested by a Retry-After header, or None when it is missing or invalid."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after) # Retry-After may also be an HTTP date
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - dt.now(timezone.utc)).total_seconds())
     
-    def paginator(self, json_data: dict, endpoint: str, limit:int , start:str, end:str) -> pd.DataFrame:
-        """Handles pagination for Whoop API responses."""
-        data = json_data.get("records")
-        response_json_list = []
-        response_json_list.extend(data)
+    def iter_record_pages(self, json_data: dict, endpoint: str, limit:int , start:str, end:str):
+        """Yields the raw records of each page along with the token for the following page, requesting pages only as they are consumed."""
         next_access_token = json_data.get("next_token")
-
-        if endpoint == 'cycle': 
-            base_url = self.cycles_base_url 
-        else: base_url = self.base_url
+        yield json_data.get("records"), next_access_token
 
         while next_access_token is not None:
-            
-            url = f"{base_url}{endpoint}"
-        
-            headers = {
-                "Authorization": f"Bearer {self.access_token}"
-                , "Accept": "application/json"
-            }   
             params = {'nextToken': next_access_token,
                 'start': start,
                 'end': end,
                 'limit': limit}
         
-            response = requests.get(url, headers=headers, params=params)
-            response.raise_for_status()
-            response_json = response.json()
-            records = response_json.get("records")
-            response_json_list.extend(records)
+            response_json = self.get_json(self.base_url, self.cycles_base_url, endpoint, params)
             next_access_token = response_json.get("next_token")
+            yield response_json.get("records"), next_access_token
+
+    def paginator(self, json_data: dict, endpoint: str, limit:int , start:str, end:str) -> pd.DataFrame:
+        """Handles pagination for Whoop API responses."""
+        response_json_list = []
+        for records, _ in self.iter_record_pages(json_data, endpoint, limit, start, end):
+            response_json_list.extend(records)
         
         df =  pd.json_normalize(response_json_list)
         
         return df
-    
 
-    def data_pipeline(self, start_date:str, end_date:str):
-        """Retrieves data from Whoop API and saves to CSV files."""
- 
-        endpoints = {'fact_cycle': 'cycle',
-                      'fact_activity_sleep':'activity/sleep',
-                        'fact_recovery':'recovery',
-                          'fact_workout':'activity/workout'}  
-        
-        
-        params = {'limit': 25, 'start': start_date, 'end': end_date}
+    def iter_chunks(self, json_data: dict, endpoint: str, limit:int , start:str, end:str, pages_per_chunk:int=1):
+        """Yields the records of every pages_per_chunk pages so memory stays bounded by the chunk size rather than the date range.
+        Each chunk comes with the token of the page following it, None once the crawl is complete. The last chunk is always yielded,
+        even without records, so the crawl ends on a None token."""
+        response_json_list = []
+        pages = 0
+        next_access_token = None
+        for records, next_access_token in self.iter_record_pages(json_data, endpoint, limit, start, end):
+            response_json_list.extend(records)
+            pages += 1
+            if pages == pages_per_chunk:
+                yield response_json_list, next_access_token
+                response_json_list = []
+                pages = 0
 
-        for endpoint_key, endpoint_value in endpoints.items(): 
-            json_data = self.get_json(self.base_url, self.cycles_base_url, endpoint_value, params) 
-            df = self.paginator(json_data, endpoint_value, params['limit'] , params['start'], params['end'])    
-            df = self.whoop_data_cleaner.clean_data(df, endpoint_value, self.model_classes[endpoint_value])
-    
-            if not df.empty:
-                if df[df.columns[0]].count() > 28:
-                    df_sample = df.sample(n=28, random_state=42) # ensures only 28 rows of data are validated to ensure the pipeline runs in a reasonable time
-                    self.data_quality_validator.assertion_tests(df_sample, self.model_classes[endpoint_value])
-                    
-                else: self.data_quality_validator.assertion_tests(df, self.model_classes[endpoint_value])
-                print(f"Data for {endpoint_key} passed all validation tests.")
+        if pages: # pages left over, perhaps only an empty final page, which still completes the checkpoint
+            yield response_json_list, next_access_token
 
-            table, primary_key, table_cols = self.whoop_database.get_model_class_data(self.model_classes[endpoint_value])
-            rows = self.whoop_database.process_dataframe(df, table_cols)
-            self.whoop_database.upsert_data(table, primary_key, table_cols, rows, session=None)
+    def records_to_frame(self, records:list, endpoint:str) -> pd.DataFrame:
+        """Turns raw API records into a cleaned DataFrame, either with the schema-driven RecordParser or with json_normalize followed by clean_data."""
+        if self.parse_method == 'direct':
+            with self.metrics.stage(endpoint, 'normalize', rows=len(records)): # the direct parser cleans as it parses, so there is no separate clean stage
+                return self.record_parsers[endpoint].parse(records)
+        with self.metrics.stage(endpoint, 'normalize', rows=len(records)):
+            df = pd.json_normalize(records)
+        with self.metrics.stage(endpoint, 'clean', rows=len(df)):
+            return self.whoop_data_cleaner.clean_data(df, endpoint, self.model_classes[endpoint])
 
+    def fetch_endpoint(self, endpoint:str, start_date:str, end_date:str, limit:int=25) -> pd.DataFrame:
+        """Fetches every page of an endpoint and returns the cleaned DataFrame."""
+        params = {'limit': limit, 'start': start_date, 'end': end_date}
+        json_data = self.get_json(self.base_url, self.cycles_base_url, endpoint, params)
+        response_json_list = []
+        for records, _ in self.iter_record_pages(json_data, endpoint, params['limit'], params['start'], params['end']):
+            response_json_list.extend(records)
+        return self.records_to_frame(response_json_list, endpoint)
+
+    def window_chunks(self, endpoint:str, start_date:str, end_date:str, pages_per_chunk:int, limit:int=25, next_token:str=None, watermark=None):
+        """Yields cleaned DataFrames for one window of an endpoint, each with the checkpoint to persist once it is loaded. Starts from next_token when resuming.
+        Every checkpoint carries the watermark the window's crawl started with, its chunks are filtered against it even after a resume."""
+        params = {'limit': limit, 'start': start_date, 'end': end_date}
+        if next_token: # empty for a window checkpointed by a backfill before its first page was fetched
+            params['nextToken'] = next_token
+        json_data = self.get_json(self.base_url, self.cycles_base_url, endpoint, params)
+        for records, next_access_token in self.iter_chunks(json_data, endpoint, params['limit'], params['start'], params['end'], pages_per_chunk):
+            checkpoint = {'endpoint': endpoint, 'window_start': start_date, 'window_end': end_date, 'next_token': next_access_token, 'watermark': watermark}
+            yield self.records_to_frame(records, endpoint), checkpoint
+
+    def endpoint_chunks(self, endpoint:str, start_date:str, end_date:str, pages_per_chunk:int=None, limit:int=25, watermark=None):
+        """Yields (cleaned DataFrame, checkpoint) pairs for an endpoint. The whole endpoint is yielded at once, without a checkpoint, unless pages_per_chunk is set.
+        When streaming, crawls interrupted by an earlier run are resumed from their checkpoint first, with the watermark they started with."""
+        if pages_per_chunk is None:
+            yield self.fetch_endpoint(endpoint, start_date, end_date, limit), None
+            return
+
+        for checkpoint in self.whoop_database.get_checkpoints(endpoint):
+            print(f"Resuming {endpoint} from {checkpoint['window_start']} to {checkpoint['window_end']} at the last checkpoint")
+            yield from self.window_chunks(endpoint, checkpoint['window_start'], checkpoint['window_end'], pages_per_chunk, limit, checkpoint['next_token'],
+                                          checkpoint['watermark'])
+
+        yield from self.window_chunks(endpoint, start_date, end_date, pages_per_chunk, limit, watermark=watermark)
+
+    def save_checkpoint(self, checkpoint:dict, endpoint:str, max_updated_at=None, session=None):
+        """Persists a crawl's position after a chunk is loaded. The endpoint watermark only moves once a whole window has loaded."""
+        if checkpoint is None:
+            if max_updated_at is not None:
+                self.whoop_database.upsert_watermark(endpoint, max_updated_at, session=session)
+        elif checkpoint['next_token'] is None:
+            self.whoop_database.complete_checkpoint(checkpoint['endpoint'], checkpoint['window_start'], checkpoint['window_end'], max_updated_at, session=session)
+        else: self.whoop_database.upsert_checkpoint(**checkpoint, max_updated_at=max_updated_at, session=session)
+
+    def put_chunk(self, chunk_queue:queue.Queue, item, stop_event:threading.Event) -> bool:
+        """Puts an item on a bounded queue, giving up if the consumer has stopped. Returns False when the item was not queued."""
+        while not stop_event.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce_chunks(self, chunk_queue:queue.Queue, stop_event:threading.Event, endpoint:str, start_date:str, end_date:str, pages_per_chunk:int=None, watermark=None):
+        """Runs on a worker thread, queueing an endpoint's cleaned chunks followed by None once it is exhausted. Errors are queued for the consumer to raise."""
+        try:
+            for chunk in self.endpoint_chunks(endpoint, start_date, end_date, pages_per_chunk, watermark=watermark):
+                if not self.put_chunk(chunk_queue, chunk, stop_event):
+                    return
+        except Exception as e:
+            self.put_chunk(chunk_queue, e, stop_event)
+            return
+        self.put_chunk(chunk_queue, None, stop_event)
+
+    def consume_chunks(self, chunk_queue:queue.Queue):
+        """Yields the chunks queued by produce_chunks until the endpoint is exhausted."""
+        while True:
+            item = chunk_queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def load_endpoint(self, endpoint_key:str, endpoint:str, df:pd.DataFrame, session=None):
+        """Validates the cleaned DataFrame and upserts it into the endpoint's table, within the given session's transaction if one is passed.
+        Returns the load's counts with max_updated_at, the highest updated_at loaded, or None if the load failed."""
+        table, primary_key, table_cols = self.whoop_database.get_model_class_data(self.model_classes[endpoint])
+        validate_in_database = self.load_method == 'copy' and settings.db_validate_in_database
+        staged = {}
+
+        def validate_staged(connection, staging_name):
+            rule_set = self.data_quality_validator.get_rule_set(self.model_classes[endpoint], self.dtype_backend)
+            removed = self.whoop_database.validate_staging(connection, staging_name, endpoint, rule_set, self.validation_mode)
+            staged['max_updated_at'] = self.whoop_database.staged_max(connection, staging_name, 'updated_at') # of the rows left to merge
+            return removed
+
+        if not validate_in_database and not df.empty: # otherwise validate_staged runs on the staging table inside bulk_load_data
+            with self.metrics.stage(endpoint, 'validate', rows=len(df)):
+                if self.validation_mode == 'quarantine':
+                    df, rejected = self.data_quality_validator.split_valid_rows(df, self.model_classes[endpoint], self.dtype_backend)
+                    if not rejected.empty:
+                        self.whoop_database.quarantine_rows(endpoint, rejected, primary_key, session=session)
+                        print(f"Quarantined {len(rejected)} records for {endpoint_key} that failed validation.")
+                else:
+                    self.data_quality_validator.assertion_tests(df, self.model_classes[endpoint], self.dtype_backend) # every row is validated
+                    print(f"Data for {endpoint_key} passed all validation tests.")
+
+        with self.metrics.stage(endpoint, 'upsert', rows=len(df)): # includes the SQL validation of staged rows when validating in the database
+            if self.load_method == 'copy':
+                result = self.whoop_database.bulk_load_data(table, primary_key, table_cols, df, session=session,
+                                                            validate=validate_staged if validate_in_database else None)
+            elif self.load_method == 'values':
+                result = self.whoop_database.upsert_values(table, primary_key, table_cols, df, session=session)
+            else:
+                rows = self.whoop_database.process_dataframe(df, table_cols)
+                result = self.whoop_database.upsert_data(table, primary_key, table_cols, rows, session=session)
+
+        if result is not None and 'max_updated_at' in staged:
+            result['max_updated_at'] = staged['max_updated_at']
+        elif result is not None:
+            result['max_updated_at'] = df['updated_at'].max() if not df.empty and pd.notna(df['updated_at'].max()) else None
+        return result
+
+    def load_chunk(self, endpoint_key:str, endpoint:str, df:pd.DataFrame, checkpoint:dict, watermark=None, session=None):
+        """Loads a chunk and advances its checkpoint, skipping records not updated since the watermark. A failed load raises so the checkpoint stays put."""
+        if checkpoint is not None:
+            watermark = checkpoint['watermark']
+        df = self.drop_unchanged_since(df, watermark)
+        result = self.load_endpoint(endpoint_key, endpoint, df, session=session)
+        if result is None:
+            raise RuntimeError(f"Loading a chunk of {endpoint_key} failed, the crawl of {endpoint} stops at its last checkpoint")
+        self.save_checkpoint(checkpoint, endpoint, result['max_updated_at'], session=session)
+
+    def incremental_start(self, endpoint:str, start_date:str):
+        """Returns the start date to fetch an endpoint from, its watermark less whoop_watermark_lookback_hours, along with the watermark.
+        Falls back to start_date when the endpoint has no watermark yet."""
+        watermark = self.whoop_database.get_watermark(endpoint)
+        if watermark is None:
+            return start_date, None
+
+        # the API filters on a record's start, which precedes its updated_at (e.g. a sleep scored the next morning), hence the lookback
+        endpoint_start = watermark - pd.Timedelta(hours=settings.whoop_watermark_lookback_hours)
+        return endpoint_start.strftime('%Y-%m-%dT%H:%M:%S.000Z'), watermark
+
+    def drop_unchanged_since(self, df:pd.DataFrame, watermark) -> pd.DataFrame:
+        """Drops records whose updated_at is not after the watermark, they are already in the database."""
+        if watermark is None or df.empty:
+            return df
+
+        if df['updated_at'].dt.tz is None:
+            watermark = watermark.tz_localize(None)
+        changed = df['updated_at'] > watermark
+        if not changed.all():
+            print(f"Skipping {(~changed).sum()} records unchanged since {watermark}")
+        return df[changed]
+
+    def data_pipeline(self, start_date:str, end_date:str, concurrent:bool=False, pages_per_chunk:int=None, incremental:bool=False, atomic:bool=False):
+        """Retrieves data from Whoop API and loads it into the database. Endpoints are fetched in parallel when concurrent is True, loaded and
+        checkpointed every pages_per_chunk pages when set, from their own watermarks when incremental is True, and in one transaction when atomic is True."""
+
+        self.metrics.reset()
+        self.data_quality_validator.reset_timings() # the rule sets are shared by the process, their timings would otherwise add up across runs
+        start_dates, watermarks = {}, {}
+        for endpoint_key, endpoint_value in self.endpoints.items():
+            if incremental:
+                start_dates[endpoint_key], watermarks[endpoint_key] = self.incremental_start(endpoint_value, start_date)
+            else: start_dates[endpoint_key], watermarks[endpoint_key] = start_date, None
+
+        try:
+            with self.whoop_database.unit_of_work() if atomic else nullcontext() as session: # session is None when each load commits on its own
+                if concurrent:
+                    self.concurrent_load(start_dates, watermarks, end_date, pages_per_chunk, session)
+                else:
+                    for endpoint_key, endpoint_value in self.endpoints.items(): 
+                        for df, checkpoint in self.endpoint_chunks(endpoint_value, start_dates[endpoint_key], end_date, pages_per_chunk, watermark=watermarks[endpoint_key]):
+                            self.load_chunk(endpoint_key, endpoint_value, df, checkpoint, watermarks[endpoint_key], session=session)
+        finally:
+            self.emit_metrics()
+
+    def emit_metrics(self):
+        """Prints the run's per-stage metrics as JSON lines, and writes them to the Prometheus textfile at whoop_metrics_textfile when it is set."""
+        self.metrics.log_json()
+        if settings.whoop_metrics_textfile:
+            self.metrics.write_textfile(settings.whoop_metrics_textfile)
+
+    def concurrent_load(self, start_dates:dict, watermarks:dict, end_date:str, pages_per_chunk:int=None, session=None):
+        """Fetches every endpoint on the thread pool while loading their chunks on the calling thread in the order of self.endpoints."""
+        stop_event = threading.Event()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            chunk_queues = {}
+            for endpoint_key, endpoint_value in self.endpoints.items():
+                chunk_queues[endpoint_key] = queue.Queue(maxsize=settings.whoop_max_buffered_chunks) # bounds the chunks held in memory while waiting to be loaded
+                executor.submit(self.produce_chunks, chunk_queues[endpoint_key], stop_event, endpoint_value, start_dates[endpoint_key], end_date, pages_per_chunk,
+                                watermarks[endpoint_key])
+
+            try:
+                for endpoint_key, endpoint_value in self.endpoints.items(): # loads in the order of self.endpoints regardless of which fetch finishes first
+                    for df, checkpoint in self.consume_chunks(chunk_queues[endpoint_key]):
+                        self.load_chunk(endpoint_key, endpoint_value, df, checkpoint, watermarks[endpoint_key], session=session)
+            finally:
+                stop_event.set() # releases producers still waiting on a full queue
+
+    def split_date_range(self, start_date:str, end_date:str, window:str='month') -> list:
+        """Splits [start_date, end_date] into contiguous month or week windows, returned as (start, end) API timestamp pairs."""
+        frequencies = {'month': 'MS', 'week': 'W-MON'} # windows start on the first of the month or on Mondays
+        if window not in frequencies:
+            raise ValueError(f"Unsupported backfill window '{window}', expected one of {list(frequencies)}")
+
+        start = pd.to_datetime(start_date, utc=True)
+        end = pd.to_datetime(end_date, utc=True)
+        boundaries = [start] + [b for b in pd.date_range(start, end, freq=frequencies[window]) if start < b < end] + [end]
+
+        return [(window_start.strftime('%Y-%m-%dT%H:%M:%S.000Z'), window_end.strftime('%Y-%m-%dT%H:%M:%S.000Z'))
+                for window_start, window_end in zip(boundaries[:-1], boundaries[1:])]
+
+    def drop_duplicate_records(self, df:pd.DataFrame, model_class) -> pd.DataFrame:
+        """Drops records returned more than once within a window's DataFrame, keeping the first."""
+        primary_key = [key.name for key in model_class.__table__.primary_key.columns]
+        return df.drop_duplicates(subset=primary_key, keep='first').reset_index(drop=True) if not df.empty else df
+
+    def queue_windows(self, executor:ThreadPoolExecutor, pending:deque, windows, count:int):
+        """Submits the fetches of the next count windows, appending (endpoint_key, endpoint, window_start, window_end, future) to pending."""
+        for endpoint_key, endpoint_value, window_start, window_end in islice(windows, count):
+            pending.append((endpoint_key, endpoint_value, window_start, window_end,
+                            executor.submit(self.fetch_endpoint, endpoint_value, window_start, window_end)))
+
+    def backfill_windows(self, windows:list) -> list:
+        """Returns (endpoint_key, endpoint, window_start, window_end) for every window to backfill in foreign-key-safe order, each endpoint's
+        windows left unfinished by an earlier run first."""
+        endpoint_windows = []
+        for endpoint_key, endpoint_value in self.endpoints.items():
+            unfinished = [(checkpoint['window_start'], checkpoint['window_end']) for checkpoint in self.whoop_database.get_checkpoints(endpoint_value)]
+            if unfinished:
+                print(f"Resuming {len(unfinished)} unfinished {endpoint_value} windows")
+            endpoint_windows.extend((endpoint_key, endpoint_value, window_start, window_end) for window_start, window_end in dict.fromkeys(unfinished + windows))
+        return endpoint_windows
+
+    def backfill_pipeline(self, start_date:str, end_date:str, window:str='month', atomic:bool=False):
+        """Backfills a long date range by crawling windows in parallel and loading each in foreign-key-safe order as soon as it is fetched,
+        with at most whoop_backfill_max_pending_windows windows held ahead of the one loading. When atomic is True all tables load in one transaction.
+        Every window is checkpointed until it has loaded, so an interrupted backfill is resumed by the next run."""
+        windows = self.split_date_range(start_date, end_date, window)
+        print(f"Backfilling {len(windows)} {window} windows from {start_date} to {end_date}")
+
+        self.metrics.reset()
+        self.data_quality_validator.reset_timings()
+        try:
+            with self.whoop_database.unit_of_work() if atomic else nullcontext() as session:
+                endpoint_windows = self.backfill_windows(windows)
+                for _, endpoint_value, window_start, window_end in endpoint_windows:
+                    self.whoop_database.upsert_checkpoint(endpoint_value, window_start, window_end, next_token='', session=session) # '' is the window's first page
+
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    pending, endpoint_windows = deque(), iter(endpoint_windows)
+                    self.queue_windows(executor, pending, endpoint_windows, settings.whoop_backfill_max_pending_windows)
+
+                    try:
+                        while pending:
+                            endpoint_key, endpoint_value, window_start, window_end, future = pending.popleft()
+                            df = future.result()
+                            self.queue_windows(executor, pending, endpoint_windows, 1) # the next fetch runs while this window loads
+
+                            # records spanning a window boundary are returned by both windows, the second upsert leaves them unchanged
+                            df = self.drop_duplicate_records(df, self.model_classes[endpoint_value])
+                            result = self.load_endpoint(endpoint_key, endpoint_value, df, session=session)
+                            if result is not None: # a window that failed to load keeps its checkpoint and is crawled again by the next run
+                                self.whoop_database.complete_checkpoint(endpoint_value, window_start, window_end, result['max_updated_at'], session=session)
+                    except BaseException:
+                        executor.shutdown(cancel_futures=True) # drops the window fetches not yet started instead of crawling them for nothing
+                        raise
+        finally:
+            self.emit_metrics()
 
 if __name__ == '__main__':
     whoop_client = WhoopClient()
@@ -115,9 +478,10 @@ if __name__ == '__main__':
     tokens = whoop_client.get_live_access_token()
     whoop_ingestor = WhoopDataIngestor(tokens.get('access_token', 0))
     whoop_db.create_tables()
-    start_date = whoop_db.get_max_date() - pd.Timedelta('7 days') # Fetch data from 7 days before the latest date in the database
-    
-    if pd.isna(start_date):
+    start_date = whoop_db.get_max_date() - pd.Timedelta('7 days') # Fetch data from 7 days before the latest date in the database for endpoints without a watermark
+    backfill = pd.isna(start_date)
+
+    if backfill:
         start_date = pd.to_datetime('2024-01-01')
     
     start_date = start_date.tz_localize('UTC').strftime('%Y-%m-%dT%H:%M:%S.000Z')
@@ -126,5 +490,12 @@ if __name__ == '__main__':
     end_date = (pd.to_datetime('now') - pd.Timedelta('1 days')).tz_localize('UTC').strftime('%Y-%m-%dT%H:%M:%S.000Z')
     print(f"Fetching data from {start_date} to {end_date}")
 
-    whoop_ingestor.data_pipeline(start_date, end_date)
+    if backfill: # first run, nothing in the database yet
+        whoop_ingestor.backfill_pipeline(start_date, end_date, window=settings.whoop_backfill_window, atomic=settings.db_atomic_runs)
+    else: whoop_ingestor.data_pipeline(start_date, end_date, concurrent=True, pages_per_chunk=settings.whoop_pages_per_chunk, incremental=True, atomic=settings.db_atomic_runs)
+    print(f"Rate limiter metrics: {whoop_ingestor.rate_limiter.metrics()}")
+    if whoop_ingestor.page_cache is not None:
+        print(f"Page cache metrics: {whoop_ingestor.page_cache.metrics()}")
+    print(f"Validation rule timings: {whoop_ingestor.data_quality_validator.rule_timings()}")
+    whoop_ingestor.close()
    
\ No newline at end of file
@@ -0,0 +1,102 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError: # not available on Windows, peak memory is then reported as 0
+    resource = None
+
+STAGES = ['fetch', 'normalize', 'clean', 'validate', 'upsert']
+COUNTERS = ['calls', 'rows', 'bytes', 'pages', 'retries']
+PROMETHEUS_METRICS = {'seconds': "Seconds spent in the stage during the last run.",
+                      'calls': "Times the stage ran during the last run.",
+                      'rows': "Rows handled by the stage during the last run.",
+                      'bytes': "Response bytes received by the stage during the last run.",
+                      'pages': "API pages fetched by the stage during the last run.",
+                      'retries': "Requests retried by the stage during the last run.",
+                      'peak_memory_bytes': "Peak resident memory of the process when the stage last finished."}
+
+
+def peak_memory_bytes() -> int:
+    """Returns the peak resident memory of the process so far, in bytes."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # ru_maxrss is in bytes on macOS and kilobytes on Linux
+
+
+class PipelineMetrics():
+    def __init__(self):
+        """Collects the duration, rows, bytes, pages, retries and peak memory of each pipeline stage per endpoint.
+        Stages run on the fetch threads as well as the loading thread, so updates are made under a lock."""
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Starts a new run, discarding the metrics collected so far."""
+        with self.lock:
+            self.run_id = uuid.uuid4().hex[:12]
+            self.started_at = time.time()
+            self.stages = {} # (endpoint, stage) -> totals
+
+    @contextmanager
+    def stage(self, endpoint:str, stage:str, rows:int=0):
+        """Times the block as a run of a stage for an endpoint. Yields a dict of counts (rows, bytes, pages, retries) the block can add to."""
+        counts = {'rows': rows, 'bytes': 0, 'pages': 0, 'retries': 0}
+        start_time = time.perf_counter()
+        try:
+            yield counts
+        finally: # failed stages are recorded too, a slow failure is still time spent
+            self.record(endpoint, stage, time.perf_counter() - start_time, **counts)
+
+    def record(self, endpoint:str, stage:str, seconds:float=0.0, **counts):
+        """Adds one run of a stage to the endpoint's totals."""
+        with self.lock:
+            totals = self.stages.setdefault((endpoint, stage), {'seconds': 0.0, **{counter: 0 for counter in COUNTERS}, 'peak_memory_bytes': 0})
+            totals['seconds'] += seconds
+            totals['calls'] += 1
+            for counter, value in counts.items():
+                totals[counter] += value
+            totals['peak_memory_bytes'] = peak_memory_bytes()
+
+    def summary(self) -> list:
+        """Returns one dict per endpoint and stage, in pipeline stage order."""
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: (item[0][0], STAGES.index(item[0][1]) if item[0][1] in STAGES else len(STAGES)))
+            return [{'endpoint': endpoint, 'stage': stage, **totals, 'seconds': round(totals['seconds'], 4)} for (endpoint, stage), totals in stages]
+
+    def log_json(self):
+        """Prints the run's metrics as JSON lines, one per endpoint and stage followed by one for the whole run."""
+        for stage in self.summary():
+            print(json.dumps({'event': 'pipeline_stage', 'run_id': self.run_id, **stage}))
+        print(json.dumps({'event': 'pipeline_run', 'run_id': self.run_id, 'seconds': round(time.time() - self.started_at, 4),
+                          'peak_memory_bytes': peak_memory_bytes()}))
+
+    def prometheus_text(self) -> str:
+        """Returns the run's metrics in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = []
+        for metric, help_text in PROMETHEUS_METRICS.items():
+            name = f"whoop_pipeline_stage_{metric}"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"] # gauges, as the file always describes the last run
+            lines += [f'{name}{{endpoint="{stage["endpoint"]}",stage="{stage["stage"]}"}} {stage[metric]}' for stage in summary]
+        lines += ["# HELP whoop_pipeline_last_run_timestamp_seconds Time the last run started.", "# TYPE whoop_pipeline_last_run_timestamp_seconds gauge",
+                  f"whoop_pipeline_last_run_timestamp_seconds {self.started_at:.3f}"]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path:str):
+        """Writes the run's metrics to a Prometheus textfile, e.g. for node_exporter's textfile collector. The file is written under a temporary
+        name and renamed so the collector never reads a partial file."""
+        path = Path(path)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.prometheus_text())
+        os.chmod(temp_path, 0o644) # mkstemp creates the file readable by its owner only
+        os.replace(temp_path, path)
@@ -0,0 +1,219 @@
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ENDPOINTS = ['cycle', 'activity/sleep', 'recovery', 'activity/workout']
+WINDOW_FIELDS = {'cycle': 'start', 'activity/sleep': 'start', 'recovery': 'created_at', 'activity/workout': 'start'} # field the API filters each endpoint's window on
+WINDOW_OFFSETS = {'cycle': 0.0, 'activity/sleep': 0.01, 'recovery': 0.32, 'activity/workout': 0.6} # where each record's window field falls within its cycle, as a fraction of the interval
+SPORTS = [('running', 0), ('cycling', 1), ('functional-fitness', 48), ('walking', 63), ('cricket', 100)]
+CYCLE_ID_BASE = 1_000_000_000 # cycle_id is an Integer column, so ids stay below 2**31
+V1_ID_BASE = 1_500_000_000
+USER_ID = 10_000_001
+MAX_PAGE_SIZE = 25 # the largest limit the WHOOP API accepts
+
+
+class SyntheticDataGenerator():
+    def __init__(self, records:int=1000, start:str="2020-01-01T00:00:00.000Z", end:str="2025-01-01T00:00:00.000Z", seed:int=42, unscored_rate:float=0.05):
+        """Generates records shaped like the WHOOP API's, one cycle with a sleep, recovery and workout per interval between start and end.
+        Every record is built on demand from its index and the seed, so millions of records can be paged through without holding any of them in memory."""
+        self.records = records
+        self.start_ms = self.to_ms(start)
+        self.interval_ms = max(1, (self.to_ms(end) - self.start_ms) // records)
+        self.seed = seed
+        self.unscored_rate = unscored_rate # share of cycles still pending a score, which come without one
+
+    def to_ms(self, timestamp:str) -> int:
+        """Returns a timestamp as milliseconds since the epoch."""
+        return pd.Timestamp(timestamp).value // 1_000_000
+
+    def timestamp(self, ms:int) -> str:
+        """Formats milliseconds since the epoch as the API does, e.g. 2025-09-10T21:52:09.817Z."""
+        return (EPOCH + timedelta(milliseconds=ms)).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+    def window_indices(self, endpoint:str, start:str=None, end:str=None) -> range:
+        """Returns the indices of the records whose window field falls in [start, end), newest first as the API pages them."""
+        offset_ms = int(self.interval_ms * WINDOW_OFFSETS[endpoint])
+        first = 0 if start is None else -(-(self.to_ms(start) - self.start_ms - offset_ms) // self.interval_ms) # ceiling division
+        stop = self.records if end is None else -(-(self.to_ms(end) - self.start_ms - offset_ms) // self.interval_ms)
+        first, stop = min(max(first, 0), self.records), min(max(stop, 0), self.records)
+        return range(stop - 1, first - 1, -1)
+
+    def record(self, endpoint:str, index:int) -> dict:
+        """Builds the record at an index. The same seed always gives the same record, so pages are stable across requests."""
+        rng = random.Random(self.seed * 10_000_019 + index * len(ENDPOINTS) + ENDPOINTS.index(endpoint))
+        at = lambda fraction: self.timestamp(self.start_ms + index * self.interval_ms + int(self.interval_ms * fraction)) # a point within the cycle
+        cycle_id = CYCLE_ID_BASE + index
+        sleep_id = str(uuid.uuid5(uuid.NAMESPACE_OID, f"{self.seed}:sleep:{index}")) # shared by the sleep and its recovery
+
+        if endpoint == 'cycle':
+            record = {"id": cycle_id, "user_id": USER_ID, "created_at": at(0.33), "updated_at": at(1.0),
+                      "start": at(0.0), "end": at(1.0), "timezone_offset": "+01:00", "score_state": "SCORED"}
+            if rng.random() < self.unscored_rate:
+                record["score_state"] = "PENDING_SCORE"
+            else:
+                record["score"] = {"strain": round(rng.uniform(0, 21), 6), "kilojoule": round(rng.uniform(4000, 15000), 3),
+                                   "average_heart_rate": rng.randint(55, 85), "max_heart_rate": rng.randint(120, 195)}
+            return record
+
+        if endpoint == 'activity/sleep':
+            stages = [rng.randint(600_000, 2_400_000), 0, rng.randint(6_000_000, 10_000_000), rng.randint(4_000_000, 8_000_000), rng.randint(4_000_000, 8_000_000)]
+            return {"id": sleep_id, "cycle_id": cycle_id, "v1_id": V1_ID_BASE + index, "user_id": USER_ID,
+                    "created_at": at(0.31), "updated_at": at(0.31), "start": at(0.01), "end": at(0.3),
+                    "timezone_offset": "+01:00", "nap": rng.random() < 0.05, "score_state": "SCORED",
+                    "score": {"stage_summary": {"total_in_bed_time_milli": sum(stages), "total_awake_time_milli": stages[0],
+                                                "total_no_data_time_milli": stages[1], "total_light_sleep_time_milli": stages[2],
+                                                "total_slow_wave_sleep_time_milli": stages[3], "total_rem_sleep_time_milli": stages[4],
+                                                "sleep_cycle_count": rng.randint(3, 7), "disturbance_count": rng.randint(0, 15)},
+                              "sleep_needed": {"baseline_milli": 27_743_245, "need_from_sleep_debt_milli": rng.randint(0, 8_000_000),
+                                               "need_from_recent_strain_milli": rng.randint(0, 2_000_000), "need_from_recent_nap_milli": 0},
+                              "respiratory_rate": round(rng.uniform(12, 18), 6), "sleep_performance_percentage": round(rng.uniform(0.5, 1), 2),
+                              "sleep_consistency_percentage": round(rng.uniform(0.4, 1), 2), "sleep_efficiency_percentage": round(rng.uniform(0.8, 1), 6)}}
+
+        if endpoint == 'recovery':
+            return {"cycle_id": cycle_id, "sleep_id": sleep_id, "user_id": USER_ID,
+                    "created_at": at(0.32), "updated_at": at(0.32), "score_state": "SCORED",
+                    "score": {"user_calibrating": False, "recovery_score": rng.randint(1, 99), "resting_heart_rate": rng.randint(45, 70),
+                              "hrv_rmssd_milli": round(rng.uniform(30, 120), 5), "spo2_percentage": round(rng.uniform(94, 99), 5),
+                              "skin_temp_celsius": round(rng.uniform(33, 36), 6)}}
+
+        sport_name, sport_id = rng.choice(SPORTS)
+        zones = [rng.randint(0, 1_500_000) for _ in range(6)]
+        score = {"strain": round(rng.uniform(0, 21), 6), "average_heart_rate": rng.randint(90, 160), "max_heart_rate": rng.randint(140, 195),
+                 "kilojoule": round(rng.uniform(100, 3000), 4), "percent_recorded": 1.0,
+                 "zone_durations": dict(zip(["zone_zero_milli", "zone_one_milli", "zone_two_milli", "zone_three_milli", "zone_four_milli", "zone_five_milli"], zones))}
+        if sport_name in ('running', 'cycling'): # only GPS tracked sports report distance and altitude
+            score.update({"distance_meter": round(rng.uniform(2000, 40000), 3), "altitude_gain_meter": round(rng.uniform(0, 400), 3),
+                          "altitude_change_meter": round(rng.uniform(-50, 50), 3)})
+        return {"id": str(uuid.uuid5(uuid.NAMESPACE_OID, f"{self.seed}:workout:{index}")), "v1_id": V1_ID_BASE + index, "user_id": USER_ID,
+                "created_at": at(0.66), "updated_at": at(0.66), "start": at(0.6), "end": at(0.65), "timezone_offset": "+01:00",
+                "sport_name": sport_name, "score_state": "SCORED", "sport_id": sport_id, "score": score}
+
+    def page(self, endpoint:str, start:str=None, end:str=None, limit:int=MAX_PAGE_SIZE, next_token:str=None) -> dict:
+        """Returns a page of records for a window, with the offset of the following page as its next_token."""
+        indices = self.window_indices(endpoint, start, end)
+        offset = int(next_token or 0)
+        next_token = str(offset + limit) if offset + limit < len(indices) else None
+        return {"records": [self.record(endpoint, index) for index in indices[offset:offset + limit]], "next_token": next_token}
+
+
+class MockWhoopHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keeps connections alive, as the ingestor's pooled session expects
+    disable_nagle_algorithm = True # headers and body are written separately, Nagle would hold the body back until the client ACKs
+
+    def do_GET(self):
+        status, headers, body = self.server.mock.handle(self.path, self.headers)
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass # one line per request would drown out the benchmark output
+
+
+class MockWhoopServer():
+    def __init__(self, generator:SyntheticDataGenerator=None, latency_seconds:float=0.0, throttle_rate:float=0.0, retry_after_seconds:float=1,
+                 host:str="127.0.0.1", port:int=0, seed:int=42):
+        """Local stand-in for the WHOOP v2 API serving the cycle, activity/sleep, recovery and activity/workout endpoints from a SyntheticDataGenerator.
+        Every request is delayed by latency_seconds, and throttle_rate of them are answered with a 429 and a Retry-After of retry_after_seconds.
+        Port 0 picks a free port, see base_url."""
+        self.generator = generator or SyntheticDataGenerator(seed=seed)
+        self.latency_seconds = latency_seconds
+        self.throttle_rate = throttle_rate
+        self.retry_after_seconds = retry_after_seconds
+        self.random = random.Random(seed) # decides which requests are throttled
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), MockWhoopHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = None
+
+        self.requests = 0
+        self.throttled = 0
+        self.records_served = 0
+
+    @property
+    def base_url(self) -> str:
+        """The base URL to point whoop_api_base_url and whoop_api_cycles_base_url at."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/developer/v2/"
+
+    def start(self):
+        """Serves requests on a background thread."""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and closes the listening socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def handle(self, path:str, headers) -> tuple:
+        """Returns the status, extra headers and JSON body of the response to a request."""
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self.lock:
+            self.requests += 1
+            throttled = self.random.random() < self.throttle_rate
+            if throttled:
+                self.throttled += 1
+        if throttled:
+            return 429, {"Retry-After": str(self.retry_after_seconds)}, {"message": "Too Many Requests"}
+
+        if not headers.get("Authorization", "").startswith("Bearer "):
+            return 401, {}, {"message": "Unauthorized"}
+        url = urlparse(path)
+        endpoint = url.path.removeprefix("/developer/v2/")
+        if endpoint not in WINDOW_FIELDS:
+            return 404, {}, {"message": f"Unknown endpoint {url.path}"}
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        try:
+            limit = int(params.get('limit', MAX_PAGE_SIZE))
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+            page = self.generator.page(endpoint, params.get('start'), params.get('end'), limit, params.get('nextToken'))
+        except ValueError as e:
+            return 400, {}, {"message": str(e)}
+
+        with self.lock:
+            self.records_served += len(page["records"])
+        return 200, {}, page
+
+    def metrics(self) -> dict:
+        """Returns the requests, throttled requests and records served so far."""
+        with self.lock:
+            return {"requests": self.requests, "throttled": self.throttled, "records_served": self.records_served}
+
+
+if __name__ == '__main__':
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8081
+    server = MockWhoopServer(SyntheticDataGenerator(records), port=port)
+    print(f"Serving {records} synthetic records per endpoint at {server.base_url}")
+    print("Point WHOOP_API_BASE_URL and WHOOP_API_CYCLES_BASE_URL at it and raise WHOOP_REQUESTS_PER_MINUTE to load test the ingestor")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship, Mapped, mapped_column, Relationship, DeclarativeBase
-from sqlalchemy.dialects.postgresql import TEXT, VARCHAR, INTEGER, FLOAT, DATE, TIMESTAMP, BIGINT
+from sqlalchemy.dialects.postgresql import TEXT, VARCHAR, INTEGER, FLOAT, DATE, TIMESTAMP, BIGINT, JSONB
 from typing import List
 from typing import Optional
 
@@ -15,7 +15,7 @@ class Base(DeclarativeBase):
 
 class Sleep(Base):
     __tablename__ = 'fact_activity_sleep'
-    sleep_id: Mapped[str] = mapped_column(VARCHAR, primary_key=True)
+    sleep_id: Mapped[str] = mapped_column(VARCHAR, primary_key=True, info={'json_path': 'id'})
     cycle_id: Mapped[int] = mapped_column(Integer, ForeignKey('fact_cycle.cycle_id', ondelete="CASCADE"))
     v1_id: Mapped[int] = mapped_column(Integer, nullable=True)
     user_id: Mapped[int]
@@ -26,22 +26,22 @@ class Sleep(Base):
     timezone_offset: Mapped[int]
     nap: Mapped[bool]
     score_state: Mapped[str| None] = mapped_column(String, nullable=True)
-    total_in_bed_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    total_awake_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    total_no_data_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    total_light_sleep_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    total_slow_wave_sleep_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    total_rem_sleep_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    sleep_cycle_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    disturbance_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    sleep_needed_baseline_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    sleep_needed_need_from_sleep_debt_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    sleep_needed_need_from_recent_strain_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    sleep_needed_need_from_recent_nap_milli: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    respiratory_rate: Mapped[float | None] = mapped_column(Float, nullable=True)
-    sleep_performance_percentage: Mapped[float | None] = mapped_column(Float, nullable=True)
-    sleep_consistency_percentage: Mapped[float | None] = mapped_column(Float, nullable=True)
-    sleep_efficiency_percentage: Mapped[float | None] = mapped_column(Float, nullable=True)
+    total_in_bed_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.stage_summary.total_in_bed_time_milli'})
+    total_awake_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.stage_summary.total_awake_time_milli'})
+    total_no_data_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.stage_summary.total_no_data_time_milli'})
+    total_light_sleep_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.stage_summary.total_light_sleep_time_milli'})
+    total_slow_wave_sleep_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.stage_summary.total_slow_wave_sleep_time_milli'})
+    total_rem_sleep_time_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.stage_summary.total_rem_sleep_time_milli'})
+    sleep_cycle_count: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.stage_summary.sleep_cycle_count'})
+    disturbance_count: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.stage_summary.disturbance_count'})
+    sleep_needed_baseline_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.sleep_needed.baseline_milli'})
+    sleep_needed_need_from_sleep_debt_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.sleep_needed.need_from_sleep_debt_milli'})
+    sleep_needed_need_from_recent_strain_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.sleep_needed.need_from_recent_strain_milli'})
+    sleep_needed_need_from_recent_nap_milli: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.sleep_needed.need_from_recent_nap_milli'})
+    respiratory_rate: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.respiratory_rate'})
+    sleep_performance_percentage: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.sleep_performance_percentage'})
+    sleep_consistency_percentage: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.sleep_consistency_percentage'})
+    sleep_efficiency_percentage: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.sleep_efficiency_percentage'})
     
     cycle: Mapped["Cycle"] = relationship("Cycle", back_populates="sleeps")
     
@@ -55,19 +55,19 @@ class Recovery(Base):
     created_at: Mapped[DateTime]
     updated_at: Mapped[DateTime]
     score_state: Mapped[str| None] = mapped_column(String, nullable=True)
-    user_calibrating: Mapped[bool]
-    recovery_score: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    resting_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    hrv_rmssd_milli: Mapped[float | None] = mapped_column(Float, nullable=True)
-    spo2_percentage: Mapped[float | None] = mapped_column(Float, nullable=True)
-    skin_temp_celsius: Mapped[float | None] = mapped_column(Float, nullable=True)
+    user_calibrating: Mapped[bool] = mapped_column(info={'json_path': 'score.user_calibrating'})
+    recovery_score: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.recovery_score', 'min': 0, 'max': 100})
+    resting_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.resting_heart_rate'})
+    hrv_rmssd_milli: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.hrv_rmssd_milli'})
+    spo2_percentage: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.spo2_percentage'})
+    skin_temp_celsius: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.skin_temp_celsius'})
 
     cycle: Mapped["Cycle"] = relationship("Cycle", back_populates="recoveries")
 
  
 class Workout(Base):
     __tablename__ = 'fact_workout'
-    workout_id: Mapped[str] = mapped_column(VARCHAR, primary_key=True)
+    workout_id: Mapped[str] = mapped_column(VARCHAR, primary_key=True, info={'json_path': 'id'})
     v1_id: Mapped[int] = mapped_column(Integer, nullable=True)
     user_id: Mapped[int]
     created_at: Mapped[DateTime]
@@ -78,25 +78,25 @@ class Workout(Base):
     sport_name: Mapped[str]
     score_state: Mapped[str| None] = mapped_column(String, nullable=True)
     sport_id: Mapped[int]
-    strain: Mapped[float | None] = mapped_column(Float, nullable=True)
-    average_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    max_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    kilojoule: Mapped[float | None] = mapped_column(Float, nullable=True)
-    percent_recorded: Mapped[float | None] = mapped_column(Float, nullable=True)
-    distance_meter: Mapped[float | None] = mapped_column(Float, nullable=True)
-    altitude_gain_meter: Mapped[float | None] = mapped_column(Float, nullable=True)
-    altitude_change_meter: Mapped[float | None] = mapped_column(Float, nullable=True)
-    zone_zero_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
-    zone_one_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
-    zone_two_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
-    zone_three_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
-    zone_four_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
-    zone_five_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    strain: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.strain', 'min': 0, 'max': 21.0})
+    average_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.average_heart_rate'})
+    max_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.max_heart_rate'})
+    kilojoule: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.kilojoule'})
+    percent_recorded: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.percent_recorded'})
+    distance_meter: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.distance_meter'})
+    altitude_gain_meter: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.altitude_gain_meter'})
+    altitude_change_meter: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.altitude_change_meter'})
+    zone_zero_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True, info={'json_path': 'score.zone_durations.zone_zero_milli'})
+    zone_one_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True, info={'json_path': 'score.zone_durations.zone_one_milli'})
+    zone_two_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True, info={'json_path': 'score.zone_durations.zone_two_milli'})
+    zone_three_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True, info={'json_path': 'score.zone_durations.zone_three_milli'})
+    zone_four_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True, info={'json_path': 'score.zone_durations.zone_four_milli'})
+    zone_five_milli: Mapped[int | None] = mapped_column(BigInteger, nullable=True, info={'json_path': 'score.zone_durations.zone_five_milli'})
 
 
 class Cycle(Base):
     __tablename__ = 'fact_cycle'
-    cycle_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    cycle_id: Mapped[int] = mapped_column(Integer, primary_key=True, info={'json_path': 'id'})
     user_id: Mapped[int]
     created_at: Mapped[DateTime]
     updated_at: Mapped[DateTime]
@@ -104,11 +104,40 @@ class Cycle(Base):
     end: Mapped[DateTime]
     timezone_offset: Mapped[int]
     score_state: Mapped[str| None] = mapped_column(String, nullable=True)
-    strain: Mapped[float | None] = mapped_column(Float, nullable=True)
-    kilojoule: Mapped[float | None] = mapped_column(Float, nullable=True)
-    average_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    max_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    strain: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.strain', 'min': 0, 'max': 21.0})
+    kilojoule: Mapped[float | None] = mapped_column(Float, nullable=True, info={'json_path': 'score.kilojoule'})
+    average_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.average_heart_rate'})
+    max_heart_rate: Mapped[int | None] = mapped_column(Integer, nullable=True, info={'json_path': 'score.max_heart_rate'})
 
     
     recoveries: Mapped[list["Recovery"]] = relationship("Recovery", back_populates="cycle", primaryjoin="Cycle.cycle_id==Recovery.cycle_id")
     sleeps: Mapped[list["Sleep"]] = relationship("Sleep", back_populates="cycle", primaryjoin="Cycle.cycle_id==Sleep.cycle_id")
+
+
+class CrawlCheckpoint(Base):
+    __tablename__ = 'crawl_checkpoints'
+    endpoint: Mapped[str] = mapped_column(VARCHAR, primary_key=True)
+    window_start: Mapped[str] = mapped_column(VARCHAR, primary_key=True)
+    window_end: Mapped[str] = mapped_column(VARCHAR, primary_key=True)
+    next_token: Mapped[str] = mapped_column(VARCHAR) # token of the first page not yet loaded, empty when that is the window's first page
+    updated_at: Mapped[DateTime]
+    watermark: Mapped[DateTime | None] = mapped_column(nullable=True) # endpoint watermark when the window's crawl started, resumed chunks are filtered against it
+    max_updated_at: Mapped[DateTime | None] = mapped_column(nullable=True) # highest updated_at loaded so far, becomes the endpoint watermark once the window completes
+
+
+class EndpointWatermark(Base):
+    __tablename__ = 'endpoint_watermarks'
+    endpoint: Mapped[str] = mapped_column(VARCHAR, primary_key=True)
+    updated_at: Mapped[DateTime] # highest updated_at loaded for the endpoint, in UTC
+
+
+class QuarantinedRecord(Base):
+    __tablename__ = 'quarantined_records'
+    # rerunning a window quarantines the same records again, only the first is kept. Records without a key cannot be told apart and are always written
+    __table_args__ = (UniqueConstraint('endpoint', 'record_key', 'failed_rules'),)
+    quarantine_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    endpoint: Mapped[str]
+    record_key: Mapped[str | None] = mapped_column(VARCHAR, nullable=True) # primary key of the failing record, null when that is what failed
+    failed_rules: Mapped[str] # comma separated names of the validation rules the record failed
+    record: Mapped[dict] = mapped_column(JSONB) # the cleaned record as it would have been loaded
+    quarantined_at: Mapped[DateTime]
@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class RateLimiter():
+    def __init__(self, requests_per_minute:float, burst:int=1, min_requests_per_minute:float=10):
+        self.max_rate = requests_per_minute / 60.0 # tokens added to the bucket per second
+        self.min_rate = min(min_requests_per_minute, requests_per_minute) / 60.0
+        self.rate = self.max_rate
+        self.capacity = burst # requests that may be sent back to back after an idle period
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0 # set from Retry-After, no request is sent before this time
+        self.lock = threading.Lock()
+
+        self.throttled_seconds = 0.0 # total time callers spent waiting on the limiter
+        self.rate_limited_responses = 0
+        self.retries = 0
+
+    def wait(self) -> float:
+        """Blocks until a token is available in the shared bucket. Returns the number of seconds waited."""
+        with self.lock: # reserves a token so concurrent threads queue up behind each other
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1 # may go negative, the deficit is the queue of threads already waiting
+            wait_time = max(0.0, -self.tokens / self.rate, self.paused_until - now)
+            self.throttled_seconds += wait_time
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    def record_success(self):
+        """Additively raises the rate back towards the configured maximum after a successful request."""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def record_rate_limited(self, retry_after:float):
+        """Pauses every caller for retry_after seconds and halves the rate after a 429 response."""
+        with self.lock:
+            self.rate_limited_responses += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def record_retry(self):
+        """Counts a retried request."""
+        with self.lock:
+            self.retries += 1
+
+    def metrics(self) -> dict:
+        """Returns the throttling metrics collected so far."""
+        with self.lock:
+            return {"throttled_seconds": round(self.throttled_seconds, 3),
+                    "rate_limited_responses": self.rate_limited_responses,
+                    "retries": self.retries,
+                    "requests_per_minute": round(self.rate * 60, 2)}
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from whoop_pipeline.data_cleaning import WhoopDataCleaner
+
+
+class RecordParser():
+    def __init__(self, endpoint:str, model_class, dtype_backend:str='numpy'):
+        """Compiles the JSON path of every model column from models.py. Columns without a 'json_path' in their info are top-level fields of the same name."""
+        self.endpoint = endpoint
+        self.model_class = model_class
+        self.cleaner = WhoopDataCleaner(dtype_backend)
+        self.plan = self.cleaner.get_cleaning_plan(endpoint, model_class)
+        self.column_names = [col.name for col in model_class.__table__.columns]
+
+        self.groups = {} # parent path -> [(column name, field name)], so each nested object is looked up once per record
+        for col in model_class.__table__.columns:
+            *parent, field = col.info.get('json_path', col.name).split('.')
+            self.groups.setdefault(tuple(parent), []).append((col.name, field))
+
+    def parse(self, records:list) -> pd.DataFrame:
+        """Parses raw API records straight into a cleaned DataFrame with the same columns and dtypes clean_data produces from json_normalize,
+        filling pre-allocated column arrays in a single pass over the records."""
+        row_count = len(records)
+        values = {name: np.empty(row_count, dtype=object) for name in self.column_names}
+
+        for i, record in enumerate(records):
+            for parent, fields in self.groups.items():
+                source = record
+                for key in parent:
+                    source = source.get(key) if isinstance(source, dict) else None
+                if not isinstance(source, dict):
+                    source = {} # e.g. no score on an unscored record
+                for name, field in fields:
+                    values[name][i] = source.get(field, np.nan) # a missing field is NaN and an explicit null is None, as with json_normalize
+
+        df = pd.DataFrame(values, columns=self.column_names)
+        if 'timezone_offset' in df.columns:
+            df['timezone_offset'] = self.cleaner.tz_offsets_to_minutes(df['timezone_offset'])
+        return self.plan.coerce(df)
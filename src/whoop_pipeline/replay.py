@@ -0,0 +1,121 @@
+import csv
+import json
+import sys
+import uuid
+from collections import Counter
+from pathlib import Path
+import pandas as pd
+from whoop_pipeline.cache import RawPageCache
+from whoop_pipeline.config import settings
+from whoop_pipeline.data_cleaning import WhoopDataCleaner
+from whoop_pipeline.mock_server import WINDOW_FIELDS
+import whoop_pipeline.models as WhoopModels
+
+DATA_PATH = Path(__file__).resolve().parents[2] / "data"
+FIXTURE_FILES = {'cycle': 'cycle_data.json',
+                 'activity/sleep': 'activity_sleep_data.csv',
+                 'recovery': 'recovery_data.csv',
+                 'activity/workout': 'activity_workout_data.csv'}
+
+
+class ReplaySource():
+    def __init__(self, data_dir:str=DATA_PATH, page_cache:RawPageCache=None):
+        """Serves recorded API pages in place of the WHOOP API, from the raw page cache when a request was cached and otherwise from the
+        fixtures in data_dir, so the ingestor's clean, validate and load path can run without the network."""
+        self.data_dir = Path(data_dir)
+        self.page_cache = page_cache
+        self.model_classes = {'cycle': WhoopModels.Cycle,
+                              'activity/sleep': WhoopModels.Sleep,
+                              'recovery': WhoopModels.Recovery,
+                              'activity/workout': WhoopModels.Workout}
+        self.records = {} # endpoint -> fixture records, read on first use
+
+    def get_json(self, endpoint:str, params:dict) -> dict:
+        """Returns the page the API would return for a request. Fixture records are filtered to the request's window and paginated
+        limit records at a time, with the offset of the following page as its next_token."""
+        if self.page_cache is not None:
+            cached_page = self.page_cache.get(endpoint, params, ignore_ttl=True) # recorded pages do not go stale when replaying
+            if cached_page is not None:
+                return cached_page
+
+        window_field = WINDOW_FIELDS[endpoint]
+        start, end = pd.Timestamp(params['start']), pd.Timestamp(params['end'])
+        records = [record for record in self.fixture_records(endpoint) if start <= pd.Timestamp(record[window_field]) < end]
+
+        offset = int(params.get('nextToken') or 0)
+        limit = params.get('limit', 25)
+        next_token = str(offset + limit) if offset + limit < len(records) else None
+        return {"records": records[offset:offset + limit], "next_token": next_token}
+
+    def fixture_records(self, endpoint:str) -> list:
+        """Returns an endpoint's fixture records shaped like API records."""
+        if endpoint not in self.records:
+            path = self.data_dir / FIXTURE_FILES[endpoint]
+            if path.suffix == '.json':
+                with open(path) as f:
+                    self.records[endpoint] = json.load(f)["records"]
+            else:
+                with open(path, newline='') as f:
+                    self.records[endpoint] = [self.unflatten(row, self.model_classes[endpoint]) for row in csv.DictReader(f)]
+            if endpoint == 'activity/sleep':
+                self.derive_sleep_ids(self.records[endpoint])
+        return self.records[endpoint]
+
+    def derive_sleep_ids(self, sleeps:list):
+        """Gives recorded sleeps whose id was not exported (every row holds the same placeholder) the sleep_id of their cycle's recovery,
+        or else an id derived from their v1_id, so each sleep loads as its own row and recoveries still join to their sleep."""
+        id_counts = Counter(sleep.get('id') for sleep in sleeps)
+        recovery_sleep_ids = {recovery['cycle_id']: recovery['sleep_id'] for recovery in self.fixture_records('recovery')}
+        for sleep in sleeps:
+            if sleep.get('id') is None or id_counts[sleep['id']] > 1:
+                sleep['id'] = recovery_sleep_ids.get(sleep['cycle_id']) or str(uuid.uuid5(uuid.NAMESPACE_URL, f"whoop-sleep-{sleep['v1_id']}"))
+
+    def unflatten(self, row:dict, model_class) -> dict:
+        """Turns a flattened CSV row back into a nested API record using each model column's json_path. Headers may join the path with '.' or '_',
+        timestamps are written back as ISO strings and minute offsets as '+HH:MM', as the API returns them. Empty cells are left out."""
+        column_types = {col: col_type for col_type, columns in WhoopDataCleaner().columns_by_type(model_class).items() for col in columns}
+        record = {}
+        for col in model_class.__table__.columns:
+            json_path = col.info.get('json_path', col.name)
+            header = next((h for h in (json_path, json_path.replace('.', '_'), col.name) if h in row), None)
+            if header is None or row[header] == '':
+                continue
+
+            value = self.parse_value(row[header], column_types[col.name], col.name)
+            *parents, field = json_path.split('.')
+            target = record
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[field] = value
+        return record
+
+    def parse_value(self, value:str, col_type:str, column_name:str):
+        """Converts a CSV cell to the JSON value the API would have returned."""
+        if column_name == 'timezone_offset':
+            if value.lstrip('-').isdigit(): # stored as minutes once cleaned
+                minutes = int(value)
+                sign = '+' if minutes >= 0 else '-'
+                return f"{sign}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+            return value
+        if col_type == 'datetime':
+            return pd.Timestamp(value).tz_convert('UTC').strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+        if col_type == 'integer':
+            return int(float(value))
+        if col_type == 'float':
+            return float(value)
+        if col_type == 'boolean':
+            return value == 'True'
+        return value
+
+
+if __name__ == '__main__':
+    from whoop_pipeline.ingest_data import WhoopDataIngestor
+
+    start_date = sys.argv[1] if len(sys.argv) > 1 else "2025-08-01T00:00:00.000Z"
+    end_date = sys.argv[2] if len(sys.argv) > 2 else "2025-10-01T00:00:00.000Z"
+    page_cache = RawPageCache(settings.whoop_cache_dir) if settings.whoop_cache_dir else None
+    whoop_ingestor = WhoopDataIngestor(access_token="replay", page_source=ReplaySource(page_cache=page_cache))
+    whoop_ingestor.whoop_database.create_tables()
+    print(f"Replaying recorded pages from {start_date} to {end_date}")
+    whoop_ingestor.data_pipeline(start_date, end_date, atomic=settings.db_atomic_runs)
+    whoop_ingestor.close()
@@ -1,55 +1,46 @@
 
 import numpy as np
 import pandas as pd
+import time
 from numpy import nan
 from datetime import date, datetime
 
 class DataValidationTests():
     
     
-    def assert_no_null(self, df:pd.DataFrame, pk_column_name:str):
-        """Test that the primary key column has unique values."""
-        if df[pk_column_name].isnull().any():
-            raise AssertionError("Primary key column contains null values.")
-        
-    def assert_unique_pk(self, df:pd.DataFrame, pk_column_name:str):
-        """Test that the primary key column has unique values."""
-        if not df[pk_column_name].is_unique: 
-            raise AssertionError("Primary key column has duplicate values.")
-
-    def assert_columns_exist(self, df:pd.DataFrame, expected_columns:list):
-        """Test that all expected columns are present in the DataFrame."""
-        missing_columns = set(expected_columns) - set(df.columns) # set returns unique values
-        if missing_columns:
-            raise AssertionError(f"Missing columns: {missing_columns}")
+    def out_of_range(self, values:pd.Series, min_value:float, max_value:float) -> pd.Series:
+        """Returns a mask of the non-null values outside [min_value, max_value]. Nulls are allowed, nullability is checked separately."""
+        return values.notna() & ~values.between(min_value, max_value)
 
-    def assert_column_types(self, df:pd.DataFrame, column_types:dict):
-        """Test that columns have the expected data types."""
-        for col, expected_type in column_types.items():
-            if col in df.columns:
-                actual_type = df[col].dtype
-                if actual_type != expected_type:
-                    raise AssertionError(f"Column '{col}' has type {actual_type}, expected {expected_type}")
-
-
-    def assert_strain_range(self, df:pd.DataFrame, min_value:float=0, max_value:float=21.0):
-        """Test that the strain column values are within the expected range."""
-        if 'strain' in df.columns:
-            df = df[df['strain'].notna()] # removes NaN values for the test
-            if not df['strain'].between(min_value, max_value).all():
-                raise AssertionError(f"Strain values are out of range ({min_value}, {max_value}) for activity starting {df.get('start')}")
-        
-    def assert_recovery_score_range(self, df:pd.DataFrame, min_value:int=0, max_value:int=100):
-        """Test that the recovery_score column values are within the expected range."""
-        if 'recovery_score' in df.columns:
-            if not df['recovery_score'].between(min_value, max_value).all():
-                raise AssertionError(f"Recovery score values are out of range ({min_value}, {max_value} on {df.get('date')})")
-    
+    def get_rule_set(self, model_class, dtype_backend:str='numpy') -> "RuleSet":
+        """Returns the validation rules for a model, compiling them from its column metadata on first use. Rule sets are shared by every validator in the process."""
+        key = (model_class, dtype_backend)
+        if key not in RULE_SETS:
+            RULE_SETS[key] = RuleSet(self, model_class, dtype_backend)
+        return RULE_SETS[key]
+
+    def failure_masks(self, df:pd.DataFrame, model_class, dtype_backend:str='numpy') -> dict:
+        """Returns a boolean mask per row-level rule, True for the rows failing it. Of rows sharing a primary key the first passes pk_unique."""
+        return self.get_rule_set(model_class, dtype_backend).failure_masks(df)
+
+    def split_valid_rows(self, df:pd.DataFrame, model_class, dtype_backend:str='numpy') -> tuple:
+        """Splits the DataFrame into the rows passing every row-level rule and the rows failing at least one, the latter with a failed_rules
+        column naming the rules they failed. Missing columns and wrong column types concern the whole DataFrame and still raise."""
+        rule_set = self.get_rule_set(model_class, dtype_backend)
+        rule_set.check_columns(df)
 
-    def assertion_tests(self, df:pd.DataFrame, model_class):
-        """Runs all validation tests on the DataFrame."""
-        pk_column_name = model_class.__table__.primary_key.columns.keys()[0]
-        expected_columns = [col.name for col in model_class.__table__.columns]
+        masks = rule_set.failure_masks(df)
+        failed = np.logical_or.reduce(list(masks.values()))
+        if not failed.any():
+            return df, df.iloc[0:0].assign(failed_rules=pd.Series(dtype=object))
+
+        rule_names = np.array(list(masks))
+        rule_matrix = np.column_stack([mask[failed] for mask in masks.values()]) # one row per failing record, one column per rule
+        failed_rules = [",".join(rule_names[row]) for row in rule_matrix]
+        return df[~failed], df[failed].assign(failed_rules=failed_rules)
+
+    def expected_column_types(self, model_class, dtype_backend:str='numpy') -> dict:
+        """Returns the pandas dtype each model column should have once cleaned with dtype_backend."""
         column_types = {col.name: str(col.type) for col in model_class.__table__.columns}
 
         type_annotation_map={
@@ -61,15 +52,94 @@ class DataValidationTests():
             'TIMESTAMP': 'datetime64[ns, UTC]',
             'BOOLEAN': 'bool'
         }
-        column_types = {k: type_annotation_map.get(v, v) for k, v in column_types.items()} # dict comprehension to replace the column type with python data types instead of the postgres types
+        if dtype_backend == 'pyarrow':
+            type_annotation_map={
+                'INTEGER': 'int64[pyarrow]',
+                'BIGINT': 'int64[pyarrow]',
+                'VARCHAR': 'string[pyarrow]',
+                'FLOAT': 'double[pyarrow]',
+                'DATE': 'Date',
+                'TIMESTAMP': 'timestamp[ns, tz=UTC][pyarrow]',
+                'BOOLEAN': 'bool[pyarrow]'
+            }
+        return {k: type_annotation_map.get(v, v) for k, v in column_types.items()} # dict comprehension to replace the column type with python data types instead of the postgres types
+
+    def rule_timings(self) -> dict:
+        """Returns the seconds spent in each rule so far, per (table, dtype backend) as each backend has its own rule set."""
+        return {(rule_set.table_name, rule_set.dtype_backend): dict(rule_set.timings) for rule_set in RULE_SETS.values()}
+
+    def reset_timings(self):
+        """Discards the rule timings collected so far, so rule_timings covers a single run. The compiled rules are kept."""
+        for rule_set in RULE_SETS.values():
+            rule_set.timings.clear()
+
+    def assertion_tests(self, df:pd.DataFrame, model_class, dtype_backend:str='numpy'):
+        """Runs all validation tests on every row of the DataFrame. Each test is a vectorized check over whole columns, so no sampling is needed.
+        dtype_backend is the backend the DataFrame was cleaned with."""
+        rule_set = self.get_rule_set(model_class, dtype_backend)
+        rule_set.check_columns(df)
+
+        for rule, mask in rule_set.failure_masks(df).items():
+            if mask.any():
+                raise AssertionError(rule_set.failure_message(rule, df, mask))
+
+        return True
+
+
+class RuleSet():
+    def __init__(self, validator:DataValidationTests, model_class, dtype_backend:str='numpy'):
+        """Compiles the validation rules of a model once from its column metadata: the primary key must be present and unique, columns that are
+        not nullable must have no nulls, and columns declaring 'min' and 'max' in their info must be within that range."""
+        table = model_class.__table__
+        self.table_name = table.name
+        self.dtype_backend = dtype_backend
+        self.pk_column_name = table.primary_key.columns.keys()[0]
+        self.expected_columns = [col.name for col in table.columns]
+        self.column_types = validator.expected_column_types(model_class, dtype_backend)
+        self.timings = {} # rule name -> total seconds spent checking it
+
+        pk = self.pk_column_name
+        # the same rules as SQL conditions on a staging table, for validating in the database; pk_occurrence numbers the rows sharing a key
+        self.sql_conditions = {'pk_not_null': f'"{pk}" IS NULL', 'pk_unique': f'"{pk}" IS NOT NULL AND pk_occurrence > 1'}
+        self.rules = {'pk_not_null': (pk, lambda values: values.isna(), "Primary key column contains {count} null values."),
+                      'pk_unique': (pk, lambda values: values.notna() & values.duplicated(keep='first'),
+                                    "Primary key column has {count} duplicate values, e.g. {examples}")} # rule name -> (column, failure mask function, message)
+        for col in table.columns:
+            if col.name == pk:
+                continue
+            if not col.nullable:
+                self.rules[f"{col.name}_not_null"] = (col.name, lambda values: values.isna(), f"Column '{col.name}' contains {{count}} null values.")
+                self.sql_conditions[f"{col.name}_not_null"] = f'"{col.name}" IS NULL'
+            if 'min' in col.info and 'max' in col.info:
+                min_value, max_value = col.info['min'], col.info['max']
+                self.rules[f"{col.name}_range"] = (col.name, lambda values, low=min_value, high=max_value: validator.out_of_range(values, low, high),
+                                                   f"{{count}} {col.name} values are out of range ({min_value}, {max_value}), e.g. {{examples}}")
+                self.sql_conditions[f"{col.name}_range"] = f'"{col.name}" NOT BETWEEN {min_value} AND {max_value}' # NULL, and so passing, for null values
+
+    def check_columns(self, df:pd.DataFrame):
+        """Raises if a model column is missing or has the wrong dtype. These concern the whole DataFrame rather than single rows."""
+        start_time = time.perf_counter()
+        missing_columns = set(self.expected_columns) - set(df.columns)
+        if missing_columns:
+            raise AssertionError(f"Missing columns: {missing_columns}")
+        for col, expected_type in self.column_types.items():
+            if df[col].dtype != expected_type:
+                raise AssertionError(f"Column '{col}' has type {df[col].dtype}, expected {expected_type}")
+        self.timings['column_types'] = self.timings.get('column_types', 0.0) + time.perf_counter() - start_time
 
+    def failure_masks(self, df:pd.DataFrame) -> dict:
+        """Returns a NumPy boolean mask per rule, True for the rows failing it, timing each rule."""
+        masks = {}
+        for rule, (column, failing, _) in self.rules.items():
+            start_time = time.perf_counter()
+            masks[rule] = np.asarray(failing(df[column]).fillna(False), dtype=bool)
+            self.timings[rule] = self.timings.get(rule, 0.0) + time.perf_counter() - start_time
+        return masks
 
+    def failure_message(self, rule:str, df:pd.DataFrame, mask:np.ndarray) -> str:
+        """Describes the rows failing a rule, with up to five of the failing values."""
+        column, _, message = self.rules[rule]
+        return message.format(count=mask.sum(), examples=df[column][mask].head(5).tolist())
 
-        self.assert_no_null(df, pk_column_name)
-        self.assert_unique_pk(df, pk_column_name)
-        self.assert_columns_exist(df, expected_columns)
-        self.assert_column_types(df, column_types)
-        self.assert_strain_range(df)
-        self.assert_recovery_score_range(df)
 
-        return True
\ No newline at end of file
+RULE_SETS = {} # (model class, dtype backend) -> RuleSet
@@ -0,0 +1,70 @@
+from whoop_pipeline.cache import RawPageCache
+from whoop_pipeline.ingest_data import WhoopDataIngestor
+import gzip
+import json
+import os
+
+
+class TestRawPageCache():
+    def setup_method(self, method):
+        self.params = {'start': "2025-01-01T00:00:00.000Z", 'end': "2025-01-02T00:00:00.000Z", 'limit': 25}
+        self.page = {"records": [{"id": 1, "score": {"strain": 10.0}}], "next_token": "token_1"}
+
+    def teardown_method(self, method):
+        pass
+
+    def test_get_returns_cached_page(self, tmp_path):
+        page_cache = RawPageCache(tmp_path)
+        assert page_cache.get('cycle', self.params) is None
+
+        page_cache.put('cycle', self.params, self.page)
+
+        assert page_cache.get('cycle', self.params) == self.page
+        assert page_cache.get('cycle', {**self.params, 'nextToken': "token_1"}) is None # each page token is cached separately
+        assert page_cache.get('recovery', self.params) is None
+        with gzip.open(page_cache.path(page_cache.key('cycle', self.params)), 'rt') as f:
+            assert json.load(f)['params'] == self.params
+        assert page_cache.metrics() == {"hits": 1, "misses": 3, "evictions": 0}
+
+    def test_expired_pages_are_fetched_again(self, tmp_path, mocker):
+        page_cache = RawPageCache(tmp_path, ttl_seconds=60)
+        mock_time = mocker.patch("whoop_pipeline.cache.time.time", return_value=1000.0)
+        page_cache.put('cycle', self.params, self.page)
+
+        mock_time.return_value = 1061.0
+
+        assert page_cache.get('cycle', self.params) is None
+        assert not page_cache.path(page_cache.key('cycle', self.params)).exists()
+
+    def test_page_evicted_while_read_is_a_miss(self, tmp_path, mocker):
+        page_cache = RawPageCache(tmp_path)
+        page_cache.put('cycle', self.params, self.page)
+        mocker.patch("whoop_pipeline.cache.os.utime", side_effect=FileNotFoundError) # another worker evicted it after it was read
+
+        assert page_cache.get('cycle', self.params) is None
+        assert page_cache.metrics() == {"hits": 0, "misses": 1, "evictions": 0}
+
+    def test_least_recently_used_pages_are_evicted(self, tmp_path):
+        page_cache = RawPageCache(tmp_path, max_bytes=8_000)
+        for day in range(1, 10):
+            params = {**self.params, 'start': f"2025-01-0{day}T00:00:00.000Z"}
+            page_cache.put('cycle', params, {"records": [{"id": i, "note": os.urandom(250).hex()} for i in range(3)], "next_token": None})
+            if day > 1:
+                assert page_cache.get('cycle', self.params) is not None # the first page is read after every write, keeping it recent
+
+        assert page_cache.metrics()["evictions"] > 0
+        assert sum(p.stat().st_size for p in tmp_path.glob('*.json.gz')) <= 8_000
+        assert page_cache.get('cycle', self.params) is not None
+
+    def test_get_json_reads_through_the_cache(self, tmp_path, mocker):
+        whoop_ingestor = WhoopDataIngestor(access_token="test_access_token")
+        whoop_ingestor.page_cache = RawPageCache(tmp_path)
+        success = mocker.Mock(status_code=200, headers={}, content=json.dumps(self.page).encode())
+        success.json.return_value = self.page
+        mock_get = mocker.patch.object(whoop_ingestor.http_session, "get", return_value=success)
+
+        first = whoop_ingestor.get_json(None, None, 'cycle', self.params)
+        second = whoop_ingestor.get_json(None, None, 'cycle', self.params)
+
+        assert first == second == self.page
+        assert mock_get.call_count == 1
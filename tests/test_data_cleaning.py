@@ -1,5 +1,8 @@
 from whoop_pipeline.data_cleaning import WhoopDataCleaner
+from whoop_pipeline.models import Cycle, Recovery
+from whoop_pipeline.test_data_quality import DataValidationTests
 import pandas as pd
+import pytest
 
 class TestDataCleaning():
     def setup_method(self, method):
@@ -74,6 +77,68 @@ class TestDataCleaning():
         assert self.whoop_data_cleaner.tz_offset_to_minutes('invalid') == 0
         assert self.whoop_data_cleaner.tz_offset_to_minutes(None) == 0
 
+    def test_tz_offsets_to_minutes(self):
+        offsets = pd.Series(['+02:30', '-01:15', 'invalid', None, float('nan'), '+01', 60, '+01:00'], index=range(10, 18))
+        minutes = self.whoop_data_cleaner.tz_offsets_to_minutes(offsets)
+
+        assert list(minutes) == [self.whoop_data_cleaner.tz_offset_to_minutes(offset) for offset in offsets]
+        assert list(minutes.index) == list(offsets.index)
+
+    def test_clean_data(self):
+        records = [{"id": 1056726802, "user_id": 14052407, "created_at": "2025-09-11T02:42:36.487Z", "updated_at": "2025-09-12T05:21:03.763Z",
+                    "start": "2025-09-10T21:52:09.817Z", "end": "2025-09-11T22:24:24.618Z", "timezone_offset": "+01:00", "score_state": "SCORED",
+                    "score": {"strain": 12.840511, "kilojoule": 10497.995, "average_heart_rate": 72, "max_heart_rate": 186}}]
+        df_test = self.whoop_data_cleaner.clean_data(pd.json_normalize(records), 'cycle', Cycle)
+
+        assert df_test['cycle_id'].iloc[0] == 1056726802
+        assert df_test['timezone_offset'].iloc[0] == 60
+        assert df_test['strain'].dtypes == float
+        assert df_test['max_heart_rate'].dtypes == 'Int64'
+        assert df_test['start'].dtypes == 'datetime64[ns, UTC]'
+
+    def test_clean_data_with_pyarrow_backend(self):
+        pytest.importorskip("pyarrow")
+        records = [{"id": 1056726802, "user_id": 14052407, "created_at": "2025-09-11T02:42:36.487Z", "updated_at": "2025-09-12T05:21:03.763Z",
+                    "start": "2025-09-10T21:52:09.817Z", "end": "2025-09-11T22:24:24.618Z", "timezone_offset": "+01:00", "score_state": "PENDING_SCORE"}]
+        df_test = WhoopDataCleaner(dtype_backend='pyarrow').clean_data(pd.json_normalize(records), 'cycle', Cycle)
+
+        assert df_test['cycle_id'].dtypes == 'int64[pyarrow]'
+        assert df_test['strain'].dtypes == 'double[pyarrow]'
+        assert df_test['start'].dtypes == 'timestamp[ns, tz=UTC][pyarrow]'
+        assert df_test['score_state'].dtypes == 'string[pyarrow]'
+        assert df_test['strain'].isna().all() and df_test['max_heart_rate'].isna().all()
+        assert DataValidationTests().assertion_tests(df_test, Cycle, dtype_backend='pyarrow')
+
+    def test_pyarrow_backend_matches_numpy_for_unscored_recovery(self):
+        pytest.importorskip("pyarrow")
+        records = [{"cycle_id": 1, "sleep_id": "a1", "user_id": 1, "created_at": "2025-01-01T08:00:00.000Z", "updated_at": "2025-01-01T08:00:00.000Z",
+                    "score_state": "SCORED", "score": {"user_calibrating": False, "recovery_score": 66}},
+                   {"cycle_id": 2, "sleep_id": "a2", "user_id": 1, "created_at": "2025-01-02T08:00:00.000Z", "updated_at": "2025-01-02T08:00:00.000Z",
+                    "score_state": "UNSCORABLE"}]
+        expected = self.whoop_data_cleaner.clean_data(pd.json_normalize(records), 'recovery', Recovery)
+        df_test = WhoopDataCleaner(dtype_backend='pyarrow').clean_data(pd.json_normalize(records), 'recovery', Recovery)
+
+        assert df_test['user_calibrating'].dtypes == 'bool[pyarrow]'
+        assert df_test['user_calibrating'].notna().all()
+        assert list(df_test['user_calibrating']) == list(expected['user_calibrating'])
+        assert DataValidationTests().assertion_tests(df_test, Recovery, dtype_backend='pyarrow')
+
+    def test_cleaning_plan_is_cached(self):
+        plan = self.whoop_data_cleaner.get_cleaning_plan('cycle', Cycle)
+
+        assert WhoopDataCleaner().get_cleaning_plan('cycle', Cycle) is plan
+        assert plan.renamed_columns(pd.Index(['id', 'score.strain'])) == ['cycle_id', 'strain']
+
+    def test_add_missing_columns(self):
+        df = pd.DataFrame(
+        {'cycle_id': [1, 2],
+            'score_state': ['PENDING_SCORE', 'UNSCORABLE']}
+        )
+        df_test = self.whoop_data_cleaner.add_missing_columns(df, Cycle)
+
+        assert set(df_test.columns) == set(Cycle.__table__.columns.keys())
+        assert df_test['strain'].isna().all()
+
     if __name__ == '__main__':
         # test_rename_id_column()
         # test_split_column_names()
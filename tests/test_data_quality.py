@@ -0,0 +1,99 @@
+from whoop_pipeline.test_data_quality import DataValidationTests
+from whoop_pipeline.data_cleaning import WhoopDataCleaner
+from whoop_pipeline.models import Cycle
+import numpy as np
+import pandas as pd
+import pytest
+
+
+class TestDataValidationTests():
+    def setup_method(self, method):
+        self.validator = DataValidationTests()
+        rows = 1000
+        start = pd.Timestamp("2025-01-01T00:00:00Z") + pd.to_timedelta(np.arange(rows), unit='h')
+        self.df = WhoopDataCleaner().clean_data(pd.DataFrame({'id': np.arange(rows), 'user_id': 1,
+                    'created_at': start.astype(str), 'updated_at': start.astype(str), 'start': start.astype(str), 'end': start.astype(str),
+                    'timezone_offset': '+01:00', 'score_state': 'SCORED', 'score.strain': 10.0, 'score.kilojoule': 9000.0,
+                    'score.average_heart_rate': 70, 'score.max_heart_rate': 180}), 'cycle', Cycle)
+
+    def teardown_method(self, method):
+        pass
+
+    def test_assertion_tests_pass(self):
+        assert self.validator.assertion_tests(self.df, Cycle)
+
+    def test_assertion_tests_check_every_row(self):
+        self.df.loc[999, 'strain'] = 25.0 # the last of 1000 rows, which a sample would likely miss
+
+        with pytest.raises(AssertionError, match="1 strain values are out of range"):
+            self.validator.assertion_tests(self.df, Cycle)
+
+    def test_assertion_tests_reject_duplicate_primary_keys(self):
+        self.df.loc[500, 'cycle_id'] = 1
+
+        with pytest.raises(AssertionError, match="1 duplicate values"):
+            self.validator.assertion_tests(self.df, Cycle)
+
+    def test_range_checks_allow_nulls(self):
+        self.df.loc[1, 'strain'] = np.nan
+        assert not self.validator.failure_masks(self.df, Cycle)['strain_range'].any()
+
+        self.df.loc[1, 'strain'] = 22.0
+        assert list(np.flatnonzero(self.validator.failure_masks(self.df, Cycle)['strain_range'])) == [1]
+
+    def test_split_valid_rows(self):
+        self.df.loc[10, 'strain'] = 25.0
+        self.df.loc[20, 'cycle_id'] = 0 # duplicates the first row's key, the first occurrence passes
+        self.df.loc[30, 'cycle_id'] = None
+
+        valid, rejected = self.validator.split_valid_rows(self.df, Cycle)
+
+        assert len(valid) == 997
+        assert list(rejected.index) == [10, 20, 30]
+        assert list(rejected['failed_rules']) == ['strain_range', 'pk_unique', 'pk_not_null']
+        assert 0 in set(valid['cycle_id'])
+
+    def test_split_valid_rows_without_failures(self):
+        valid, rejected = self.validator.split_valid_rows(self.df, Cycle)
+
+        assert len(valid) == 1000
+        assert rejected.empty and 'failed_rules' in rejected.columns
+
+    def test_rule_set_is_compiled_from_model_metadata(self):
+        rule_set = self.validator.get_rule_set(Cycle)
+
+        assert DataValidationTests().get_rule_set(Cycle) is rule_set
+        assert {'pk_not_null', 'pk_unique', 'end_not_null', 'strain_range'} <= set(rule_set.rules)
+        assert 'kilojoule_not_null' not in rule_set.rules # nullable columns may hold nulls
+
+    def test_not_nullable_columns_are_checked(self):
+        self.df.loc[5, 'end'] = pd.NaT
+
+        valid, rejected = self.validator.split_valid_rows(self.df, Cycle)
+
+        assert list(rejected['failed_rules']) == ['end_not_null']
+
+    def test_rule_timings(self):
+        self.validator.assertion_tests(self.df, Cycle)
+
+        timings = self.validator.rule_timings()[('fact_cycle', 'numpy')]
+        assert set(self.validator.get_rule_set(Cycle).rules) | {'column_types'} <= set(timings)
+        assert all(seconds >= 0 for seconds in timings.values())
+
+    def test_rule_timings_are_kept_per_dtype_backend(self):
+        self.validator.reset_timings()
+        self.validator.assertion_tests(self.df, Cycle)
+        self.validator.get_rule_set(Cycle, 'pyarrow') # compiled but not run, so its timings must not replace the numpy ones
+
+        timings = self.validator.rule_timings()
+        assert timings[('fact_cycle', 'numpy')] != {}
+        assert timings[('fact_cycle', 'pyarrow')] == {}
+
+    def test_reset_timings_keeps_the_compiled_rules(self):
+        rule_set = self.validator.get_rule_set(Cycle)
+        self.validator.assertion_tests(self.df, Cycle)
+
+        self.validator.reset_timings()
+
+        assert self.validator.rule_timings()[('fact_cycle', 'numpy')] == {}
+        assert self.validator.get_rule_set(Cycle) is rule_set
@@ -1,4 +1,8 @@
 from whoop_pipeline.database import WhoopDB
+from whoop_pipeline.ingest_data import WhoopDataIngestor
+from whoop_pipeline.data_cleaning import WhoopDataCleaner
+from whoop_pipeline.test_data_quality import DataValidationTests
+from whoop_pipeline.replay import ReplaySource
 from whoop_pipeline.models import Sleep
 import pandas as pd
 import pytest
@@ -9,6 +13,7 @@ from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import sessionmaker
 from whoop_pipeline.config import settings 
 import datetime
+from contextlib import nullcontext
 import whoop_pipeline.models as WhoopModels
 from sqlalchemy import text
 
@@ -73,7 +78,223 @@ class TestWhoopDB():
         assert data["timezone_offset"].iloc[0] == self.test_data["timezone_offset"]
         assert data["score_state"].iloc[0] == self.test_data["score_state"]
 
+    def test_upsert_data_skips_unchanged_rows(self):
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+        changed_data = {**self.test_data, "score_state": "SCORED"}
+
+        first = self.db.upsert_data(table, primary_key=primary_key, table_cols=table_cols, rows=[self.test_data], session=self.session)
+        repeat = self.db.upsert_data(table, primary_key=primary_key, table_cols=table_cols, rows=[self.test_data], session=self.session)
+        changed = self.db.upsert_data(table, primary_key=primary_key, table_cols=table_cols, rows=[changed_data], session=self.session)
+
+        assert first == {"inserted": 1, "updated": 0, "unchanged": 0}
+        assert repeat == {"inserted": 0, "updated": 0, "unchanged": 1}
+        assert changed == {"inserted": 0, "updated": 1, "unchanged": 0}
+
+
+
+    def test_upsert_data_in_batches(self):
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+        rows = [{**self.test_data, "cycle_id": cycle_id} for cycle_id in range(1000, 1005)]
 
+        counts = self.db.upsert_data(table, primary_key=primary_key, table_cols=table_cols, rows=rows, session=self.session, batch_size=2)
+        data = pd.read_sql(text("SELECT COUNT(*) AS n FROM FACT_CYCLE WHERE CYCLE_ID BETWEEN 1000 AND 1004"), con=self.connection)
+
+        assert counts == {"inserted": 5, "updated": 0, "unchanged": 0}
+        assert data["n"].iloc[0] == 5
+
+    def test_upsert_batch_size(self):
+        assert self.db.upsert_batch_size(table_cols=["a"] * 30, batch_size=1000) == 1000
+        assert self.db.upsert_batch_size(table_cols=["a"] * 30, batch_size=100000) == 65535 // 30 # capped by the bind parameter limit
+
+    def test_bulk_load_data(self):
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+        df = pd.DataFrame([{**self.test_data, "cycle_id": cycle_id, "strain": None} for cycle_id in range(2000, 2003)])
+        df["created_at"] = pd.to_datetime(df["created_at"]).dt.tz_localize("UTC")
+        df["average_heart_rate"] = pd.array([50, None, 70], dtype="Int64")
+
+        first = self.db.bulk_load_data(table, primary_key, table_cols, df, session=self.session, batch_size=2)
+        repeat = self.db.bulk_load_data(table, primary_key, table_cols, df, session=self.session)
+        data = pd.read_sql(text("SELECT * FROM FACT_CYCLE WHERE CYCLE_ID BETWEEN 2000 AND 2002 ORDER BY CYCLE_ID"), con=self.connection)
+
+        assert first == {"inserted": 3, "updated": 0, "unchanged": 0}
+        assert repeat == {"inserted": 0, "updated": 0, "unchanged": 3}
+        assert data["average_heart_rate"].isna().tolist() == [False, True, False]
+        assert data["strain"].isna().all()
+        assert data["score_state"].iloc[0] == self.test_data["score_state"]
+
+    def test_upsert_values(self):
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+        df = pd.DataFrame([{**self.test_data, "cycle_id": cycle_id} for cycle_id in range(4000, 4003)])
+        df["created_at"] = pd.to_datetime(df["created_at"]).dt.tz_localize("UTC")
+        df["average_heart_rate"] = pd.array([50, None, 70], dtype="Int64")
+        df["strain"] = [1.5, float("nan"), 2.5]
+
+        first = self.db.upsert_values(table, primary_key, table_cols, df, session=self.session, batch_size=2)
+        df.loc[0, "score_state"] = "PENDING_SCORE"
+        repeat = self.db.upsert_values(table, primary_key, table_cols, df, session=self.session)
+        data = pd.read_sql(text("SELECT * FROM FACT_CYCLE WHERE CYCLE_ID BETWEEN 4000 AND 4002 ORDER BY CYCLE_ID"), con=self.connection)
+
+        assert first == {"inserted": 3, "updated": 0, "unchanged": 0}
+        assert repeat == {"inserted": 0, "updated": 1, "unchanged": 2}
+        assert data["average_heart_rate"].isna().tolist() == [False, True, False]
+        assert data["strain"].isna().tolist() == [False, True, False]
+        assert data["score_state"].iloc[0] == "PENDING_SCORE"
+
+    def test_process_dataframe_with_pyarrow_backend(self):
+        pytest.importorskip("pyarrow")
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+        records = [{"id": 3000, "user_id": 1, "created_at": "2025-01-01T00:00:00.000Z", "updated_at": "2025-01-01T00:00:00.000Z",
+                    "start": "2025-01-01T00:00:00.000Z", "end": "2025-01-02T00:00:00.000Z", "timezone_offset": "+01:00", "score_state": None}]
+        df = WhoopDataCleaner(dtype_backend='pyarrow').clean_data(pd.json_normalize(records), 'cycle', WhoopModels.Cycle)
+
+        rows = self.db.process_dataframe(df, table_cols)
+        counts = self.db.upsert_data(table, primary_key=primary_key, table_cols=table_cols, rows=rows, session=self.session)
+        data = pd.read_sql(text("SELECT * FROM FACT_CYCLE WHERE CYCLE_ID = 3000"), con=self.connection)
+
+        assert rows[0]["score_state"] is None and rows[0]["strain"] is None
+        assert counts == {"inserted": 1, "updated": 0, "unchanged": 0}
+        assert data["score_state"].isna().all() # a null string is stored as NULL rather than 'None'
+        assert data["timezone_offset"].iloc[0] == 60
+
+    def test_load_methods_write_the_same_nulls(self):
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+        records = [{"id": 3001, "user_id": 1, "created_at": "2025-01-01T00:00:00.000Z", "updated_at": "2025-01-01T00:00:00.000Z",
+                    "start": "2025-01-01T00:00:00.000Z", "end": "2025-01-02T00:00:00.000Z", "timezone_offset": "+01:00", "score_state": "PENDING_SCORE"},
+                   {"id": 3002, "user_id": 1, "created_at": "2025-01-02T00:00:00.000Z", "updated_at": "2025-01-02T00:00:00.000Z",
+                    "start": "2025-01-02T00:00:00.000Z", "end": "2025-01-03T00:00:00.000Z", "timezone_offset": "+01:00", "score_state": "SCORED",
+                    "score": {"strain": 5.0, "kilojoule": 5000.0, "average_heart_rate": 60, "max_heart_rate": 150}}]
+        df = WhoopDataCleaner().clean_data(pd.json_normalize(records), 'cycle', WhoopModels.Cycle) # numpy backend, so the missing strain is NaN
+
+        rows = self.db.process_dataframe(df, table_cols)
+        self.db.upsert_data(table, primary_key=primary_key, table_cols=table_cols, rows=rows, session=self.session)
+        data = pd.read_sql(text("SELECT strain FROM FACT_CYCLE WHERE CYCLE_ID = 3001 AND STRAIN IS NULL"), con=self.connection)
+        reloaded = self.db.bulk_load_data(table, primary_key, table_cols, df, session=self.session)
+
+        assert rows[0]["strain"] is None
+        assert len(data) == 1 # NULL rather than NaN
+        assert reloaded == {"inserted": 0, "updated": 0, "unchanged": 2} # switching load method does not rewrite unchanged rows
+
+    def staged_cycles(self) -> pd.DataFrame:
+        """Cycles for the staging validation tests: a duplicate key, an out-of-range strain and a null end."""
+        df = pd.DataFrame([{**self.test_data, "cycle_id": cycle_id, "strain": strain} for cycle_id, strain in [(6000, 10.0), (6001, 30.0), (6000, 5.0), (6002, 1.0)]])
+        df["created_at"] = pd.to_datetime(df["created_at"]).dt.tz_localize("UTC")
+        df.loc[3, "end"] = pd.NaT
+        return df
+
+    def test_bulk_load_data_validates_staged_rows(self):
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+        rule_set = DataValidationTests().get_rule_set(WhoopModels.Cycle)
+
+        with pytest.raises(AssertionError, match="'pk_unique': 1, 'end_not_null': 1, 'strain_range': 1"):
+            self.db.bulk_load_data(table, primary_key, table_cols, self.staged_cycles(), session=self.session,
+                                   validate=lambda connection, staging_name: self.db.validate_staging(connection, staging_name, "cycle", rule_set))
+
+    def test_bulk_load_data_quarantines_staged_rows(self):
+        WhoopModels.Base.metadata.create_all(bind=self.connection, tables=[WhoopModels.QuarantinedRecord.__table__])
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+        rule_set = DataValidationTests().get_rule_set(WhoopModels.Cycle)
+
+        counts = self.db.bulk_load_data(table, primary_key, table_cols, self.staged_cycles(), session=self.session,
+                                        validate=lambda connection, staging_name: self.db.validate_staging(connection, staging_name, "cycle", rule_set, "quarantine"))
+        loaded = pd.read_sql(text("SELECT * FROM FACT_CYCLE WHERE CYCLE_ID BETWEEN 6000 AND 6002"), con=self.connection)
+        quarantined = pd.read_sql(text("SELECT * FROM QUARANTINED_RECORDS WHERE ENDPOINT = 'cycle' ORDER BY RECORD_KEY"), con=self.connection)
+
+        assert counts == {"inserted": 1, "updated": 0, "unchanged": 0}
+        assert list(loaded["strain"]) == [10.0] # the first of the rows sharing cycle_id 6000
+        assert list(quarantined["record_key"]) == ["6000", "6001", "6002"]
+        assert list(quarantined["failed_rules"]) == ["pk_unique", "strain_range", "end_not_null"]
+        assert quarantined["record"].iloc[1]["strain"] == 30.0
+
+    def test_rerun_does_not_quarantine_staged_rows_twice(self):
+        WhoopModels.Base.metadata.create_all(bind=self.connection, tables=[WhoopModels.QuarantinedRecord.__table__])
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+        rule_set = DataValidationTests().get_rule_set(WhoopModels.Cycle)
+        validate = lambda connection, staging_name: self.db.validate_staging(connection, staging_name, "cycle", rule_set, "quarantine")
+
+        self.db.bulk_load_data(table, primary_key, table_cols, self.staged_cycles(), session=self.session, validate=validate)
+        counts = self.db.bulk_load_data(table, primary_key, table_cols, self.staged_cycles(), session=self.session, validate=validate)
+        quarantined = pd.read_sql(text("SELECT * FROM QUARANTINED_RECORDS WHERE ENDPOINT = 'cycle' AND RECORD_KEY IN ('6000', '6001', '6002')"), con=self.connection)
+
+        assert counts == {"inserted": 0, "updated": 0, "unchanged": 1} # the quarantined rows are not counted as merged
+        assert len(quarantined) == 3
+
+    def test_load_endpoint_max_updated_at_excludes_quarantined_rows(self, monkeypatch):
+        WhoopModels.Base.metadata.create_all(bind=self.connection, tables=[WhoopModels.QuarantinedRecord.__table__])
+        monkeypatch.setattr(settings, "db_validate_in_database", True)
+        ingestor = WhoopDataIngestor(access_token="test_access_token", load_method="copy", validation_mode="quarantine")
+        df = self.staged_cycles()
+        df["updated_at"] = pd.to_datetime(["2025-01-01T00:00:00Z", "2025-03-01T00:00:00Z", "2025-02-01T00:00:00Z", "2025-04-01T00:00:00Z"])
+
+        result = ingestor.load_endpoint("fact_cycle", "cycle", df, session=self.session)
+
+        assert result["max_updated_at"] == pd.Timestamp("2025-01-01T00:00:00Z") # the later rows were quarantined
+
+    def test_replay_loads_fixtures(self, mocker):
+        WhoopModels.Base.metadata.create_all(bind=self.connection, tables=[WhoopModels.EndpointWatermark.__table__])
+        ingestor = WhoopDataIngestor(access_token="replay", page_source=ReplaySource())
+        mocker.patch.object(ingestor.whoop_database, "unit_of_work", return_value=nullcontext(self.session)) # loads into the test's transaction
+
+        ingestor.data_pipeline("2025-08-01T00:00:00.000Z", "2025-10-01T00:00:00.000Z", atomic=True)
+        sleeps = pd.read_sql(text("SELECT s.sleep_id FROM FACT_ACTIVITY_SLEEP s JOIN FACT_CYCLE c USING (cycle_id) WHERE s.start >= '2025-08-01'"), con=self.connection)
+        recoveries = pd.read_sql(text("SELECT r.sleep_id FROM FACT_RECOVERY r JOIN FACT_ACTIVITY_SLEEP s USING (sleep_id) WHERE r.created_at >= '2025-08-01'"), con=self.connection)
+
+        assert sleeps["sleep_id"].nunique() == 10 # every recorded sleep, each with its own id
+        assert len(recoveries) == 4 # recoveries share the id of their sleep
+
+    def test_quarantine_rows(self):
+        WhoopModels.Base.metadata.create_all(bind=self.connection, tables=[WhoopModels.QuarantinedRecord.__table__])
+        df = pd.DataFrame({"cycle_id": pd.array([5000, None], dtype="Int64"), "strain": [25.0, float("nan")],
+                           "start": pd.to_datetime(["2025-01-01T00:00:00Z", None]), "failed_rules": ["strain_range", "pk_not_null"]})
+
+        quarantined = self.db.quarantine_rows("cycle", df, ["cycle_id"], session=self.session)
+        data = pd.read_sql(text("SELECT * FROM QUARANTINED_RECORDS WHERE ENDPOINT = 'cycle' ORDER BY QUARANTINE_ID DESC LIMIT 2"), con=self.connection)
+
+        assert quarantined == 2
+        assert list(data["record_key"]) == [None, "5000"]
+        assert list(data["failed_rules"]) == ["pk_not_null", "strain_range"]
+        assert data["record"].iloc[1] == {"cycle_id": 5000, "strain": 25.0, "start": "2025-01-01T00:00:00.000Z"}
+        assert data["record"].iloc[0]["strain"] is None
+
+    def test_quarantine_rows_skips_records_already_quarantined(self):
+        WhoopModels.Base.metadata.create_all(bind=self.connection, tables=[WhoopModels.QuarantinedRecord.__table__])
+        df = pd.DataFrame({"cycle_id": pd.array([5001, None], dtype="Int64"), "strain": [25.0, float("nan")], "failed_rules": ["strain_range", "pk_not_null"]})
+
+        self.db.quarantine_rows("cycle", df, ["cycle_id"], session=self.session)
+        self.db.quarantine_rows("cycle", df, ["cycle_id"], session=self.session)
+        keyed = pd.read_sql(text("SELECT * FROM QUARANTINED_RECORDS WHERE ENDPOINT = 'cycle' AND RECORD_KEY = '5001'"), con=self.connection)
+
+        assert len(keyed) == 1
+
+    def test_unit_of_work_rolls_back_every_table(self):
+        table = WhoopModels.Cycle.__table__
+        primary_key = [key.name for key in table.primary_key.columns]
+        table_cols = [col.name for col in table.columns]
+
+        with pytest.raises(RuntimeError):
+            with self.db.unit_of_work() as session:
+                self.db.upsert_data(table, primary_key=primary_key, table_cols=table_cols, rows=[{**self.test_data, "cycle_id": 3000}], session=session)
+                raise RuntimeError("later table failed")
+
+        data = self.db.read_sql(text("SELECT COUNT(*) AS n FROM FACT_CYCLE WHERE CYCLE_ID = 3000"))
+        assert data["n"].iloc[0] == 0
 
     def test_get_model_class_data(self):
         sleep_model = Sleep()
@@ -96,5 +317,37 @@ class TestWhoopDB():
 
         assert isinstance(token_data, dict)
 
+    def test_checkpoints(self):
+        WhoopModels.Base.metadata.create_all(bind=self.connection, tables=[WhoopModels.CrawlCheckpoint.__table__, WhoopModels.EndpointWatermark.__table__])
+        window = {"endpoint": "cycle", "window_start": "2025-01-01T00:00:00.000Z", "window_end": "2025-02-01T00:00:00.000Z"}
+        watermark = pd.Timestamp("2025-01-01T00:00:00Z")
+
+        self.db.upsert_checkpoint(next_token="token_1", watermark=watermark, max_updated_at=pd.Timestamp("2025-01-30T00:00:00Z"), session=self.session, **window)
+        self.db.upsert_checkpoint(next_token="token_2", watermark=pd.Timestamp("2025-01-20T00:00:00Z"), max_updated_at=pd.Timestamp("2025-01-10T00:00:00Z"),
+                                  session=self.session, **window) # an older chunk
+        checkpoints = self.db.get_checkpoints("cycle", connection=self.connection)
+        assert checkpoints == [{**window, "next_token": "token_2", "watermark": watermark}] # the watermark the crawl started with is kept
+        assert self.db.get_watermark("cycle", connection=self.connection) is None # nothing is promoted until the window completes
+
+        self.db.complete_checkpoint(max_updated_at=pd.Timestamp("2025-01-05T00:00:00Z"), session=self.session, **window)
+        assert self.db.get_checkpoints("cycle", connection=self.connection) == []
+        assert self.db.get_watermark("cycle", connection=self.connection) == pd.Timestamp("2025-01-30T00:00:00Z") # the highest staged updated_at
+
+    def test_complete_checkpoint_without_staged_chunks(self):
+        WhoopModels.Base.metadata.create_all(bind=self.connection, tables=[WhoopModels.CrawlCheckpoint.__table__, WhoopModels.EndpointWatermark.__table__])
+        window = {"endpoint": "cycle", "window_start": "2025-01-01T00:00:00.000Z", "window_end": "2025-02-01T00:00:00.000Z"}
+
+        self.db.complete_checkpoint(max_updated_at=None, session=self.session, **window) # a single empty chunk
+        assert self.db.get_watermark("cycle", connection=self.connection) is None
+
+        self.db.complete_checkpoint(max_updated_at=pd.Timestamp("2025-01-05T00:00:00Z"), session=self.session, **window) # a single chunk window
+        assert self.db.get_watermark("cycle", connection=self.connection) == pd.Timestamp("2025-01-05T00:00:00Z")
+
+    def test_watermarks(self):
+        WhoopModels.Base.metadata.create_all(bind=self.connection, tables=[WhoopModels.EndpointWatermark.__table__])
+        assert self.db.get_watermark("cycle", connection=self.connection) is None
+
+        self.db.upsert_watermark("cycle", pd.Timestamp("2025-09-12T05:21:03.763Z"), session=self.session)
+        self.db.upsert_watermark("cycle", pd.Timestamp("2025-09-10T00:00:00Z"), session=self.session) # older chunk loaded later
 
-    
+        assert self.db.get_watermark("cycle", connection=self.connection) == pd.Timestamp("2025-09-12T05:21:03.763Z")
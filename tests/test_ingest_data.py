@@ -0,0 +1,321 @@
+from whoop_pipeline.ingest_data import WhoopDataIngestor
+from whoop_pipeline.rate_limiter import RateLimiter
+from whoop_pipeline.config import settings
+import pandas as pd
+import pytest
+import requests
+import threading
+import time
+
+
+class TestWhoopDataIngestor():
+    def setup_method(self, method):
+        self.whoop_ingestor = WhoopDataIngestor(access_token="test_access_token", max_workers=4)
+
+    def teardown_method(self, method):
+        pass
+
+    def test_concurrent_data_pipeline_loads_in_foreign_key_order(self, mocker):
+        fetch_delays = {'cycle': 0.3, 'activity/sleep': 0.0, 'recovery': 0.1, 'activity/workout': 0.0} # cycle finishes last
+
+        def fake_fetch(endpoint, start_date, end_date, limit=25):
+            time.sleep(fetch_delays[endpoint])
+            return pd.DataFrame({'endpoint': [endpoint]})
+
+        mocker.patch.object(self.whoop_ingestor, "fetch_endpoint", side_effect=fake_fetch)
+        mock_load = mocker.patch.object(self.whoop_ingestor, "load_endpoint", return_value={"max_updated_at": None})
+        reset_timings = mocker.patch.object(self.whoop_ingestor.data_quality_validator, "reset_timings")
+
+        self.whoop_ingestor.data_pipeline("2025-01-01T00:00:00.000Z", "2025-01-02T00:00:00.000Z", concurrent=True)
+
+        loaded_tables = [call.args[0] for call in mock_load.call_args_list]
+        assert loaded_tables == ['fact_cycle', 'fact_activity_sleep', 'fact_recovery', 'fact_workout']
+        assert mock_load.call_args_list[0].args[2]['endpoint'].iloc[0] == 'cycle'
+        reset_timings.assert_called_once() # rule timings cover this run only
+
+    def test_paginator_reuses_http_session(self, mocker):
+        mock_get = mocker.patch.object(self.whoop_ingestor.http_session, "get")
+        mock_get.return_value.json.side_effect = [
+            {"records": [{"id": 2, "score": {"strain": 5.0}}], "next_token": None},
+        ]
+        first_page = {"records": [{"id": 1, "score": {"strain": 10.0}}], "next_token": "token_1"}
+
+        df = self.whoop_ingestor.paginator(first_page, "cycle", 25, "2025-01-01", "2025-01-02")
+
+        assert list(df['id']) == [1, 2]
+        assert mock_get.call_args.kwargs['params']['nextToken'] == "token_1"
+        assert self.whoop_ingestor.http_session.headers["Authorization"] == "Bearer test_access_token"
+
+    def test_streaming_data_pipeline_loads_each_chunk(self, mocker):
+        pages = [
+            {"records": [{"id": 2, "user_id": 1, "timezone_offset": "+01:00", "score_state": "SCORED", "score": {"strain": 5.0}}], "next_token": "token_2"},
+            {"records": [{"id": 1, "user_id": 1, "timezone_offset": "+01:00", "score_state": "PENDING_SCORE"}], "next_token": None},
+        ]
+        mocker.patch.object(self.whoop_ingestor, "get_json", side_effect=lambda *args: pages.pop(0))
+        mocker.patch.object(self.whoop_ingestor.whoop_database, "get_checkpoints", return_value=[])
+        mock_save_checkpoint = mocker.patch.object(self.whoop_ingestor, "save_checkpoint")
+        self.whoop_ingestor.endpoints = {'fact_cycle': 'cycle'}
+        mock_load = mocker.patch.object(self.whoop_ingestor, "load_endpoint", return_value={"max_updated_at": None})
+
+        self.whoop_ingestor.data_pipeline("2025-01-01T00:00:00.000Z", "2025-01-02T00:00:00.000Z", pages_per_chunk=1)
+
+        loaded_chunks = [call.args[2] for call in mock_load.call_args_list]
+        assert [list(df['cycle_id']) for df in loaded_chunks] == [[2], [1]]
+        assert 'strain' in loaded_chunks[1].columns # missing score columns are still present on unscored pages
+        assert [call.args[0]['next_token'] for call in mock_save_checkpoint.call_args_list] == ["token_2", None]
+
+    def test_streaming_data_pipeline_resumes_from_checkpoint(self, mocker):
+        checkpoint = {'endpoint': 'cycle', 'window_start': "2024-12-01T00:00:00.000Z", 'window_end': "2024-12-31T00:00:00.000Z", 'next_token': "token_9",
+                      'watermark': None}
+        mock_get_json = mocker.patch.object(self.whoop_ingestor, "get_json", return_value={"records": [], "next_token": None})
+        mocker.patch.object(self.whoop_ingestor.whoop_database, "get_checkpoints", return_value=[checkpoint])
+        mocker.patch.object(self.whoop_ingestor, "load_endpoint")
+        mocker.patch.object(self.whoop_ingestor, "save_checkpoint")
+        self.whoop_ingestor.endpoints = {'fact_cycle': 'cycle'}
+
+        self.whoop_ingestor.data_pipeline("2025-01-01T00:00:00.000Z", "2025-01-02T00:00:00.000Z", pages_per_chunk=1)
+
+        resumed_params = mock_get_json.call_args_list[0].args[3]
+        assert resumed_params['nextToken'] == "token_9"
+        assert resumed_params['start'] == checkpoint['window_start']
+        assert mock_get_json.call_args_list[1].args[3]['start'] == "2025-01-01T00:00:00.000Z"
+
+    def test_failed_chunk_is_fetched_again_on_the_next_run(self, mocker):
+        pages = {None: {"records": [{"id": 3, "user_id": 1, "timezone_offset": "+01:00", "score_state": "PENDING_SCORE"}], "next_token": "token_2"},
+                 "token_2": {"records": [{"id": 2, "user_id": 1, "timezone_offset": "+01:00", "score_state": "PENDING_SCORE"}], "next_token": "token_3"},
+                 "token_3": {"records": [{"id": 1, "user_id": 1, "timezone_offset": "+01:00", "score_state": "PENDING_SCORE"}], "next_token": None}}
+        mocker.patch.object(self.whoop_ingestor, "get_json", side_effect=lambda base_url, cycles_url, endpoint, params: pages[params.get('nextToken')])
+        mock_get_checkpoints = mocker.patch.object(self.whoop_ingestor.whoop_database, "get_checkpoints", return_value=[])
+        mock_upsert_checkpoint = mocker.patch.object(self.whoop_ingestor.whoop_database, "upsert_checkpoint")
+        mock_complete_checkpoint = mocker.patch.object(self.whoop_ingestor.whoop_database, "complete_checkpoint")
+        mock_load = mocker.patch.object(self.whoop_ingestor, "load_endpoint", side_effect=[{"inserted": 1, "max_updated_at": None}, None]) # the second chunk's upsert fails
+        self.whoop_ingestor.endpoints = {'fact_cycle': 'cycle'}
+
+        with pytest.raises(RuntimeError):
+            self.whoop_ingestor.data_pipeline("2025-01-01T00:00:00.000Z", "2025-01-02T00:00:00.000Z", pages_per_chunk=1)
+
+        assert [call.kwargs['next_token'] for call in mock_upsert_checkpoint.call_args_list] == ["token_2"]
+        mock_complete_checkpoint.assert_not_called()
+
+        saved = mock_upsert_checkpoint.call_args.kwargs
+        mock_get_checkpoints.return_value = [{key: saved[key] for key in ['endpoint', 'window_start', 'window_end', 'next_token', 'watermark']}]
+        mock_load.side_effect = None
+        mock_load.return_value = {"inserted": 1, "max_updated_at": None}
+        self.whoop_ingestor.data_pipeline("2025-01-01T00:00:00.000Z", "2025-01-02T00:00:00.000Z", pages_per_chunk=1)
+
+        assert list(mock_load.call_args_list[2].args[2]['cycle_id']) == [2] # the rerun resumes at the failed chunk
+
+    def test_empty_trailing_page_completes_the_checkpoint(self, mocker):
+        pages = {None: {"records": [{"id": 3, "user_id": 1, "timezone_offset": "+01:00", "score_state": "PENDING_SCORE"}], "next_token": "token_2"},
+                 "token_2": {"records": [{"id": 2, "user_id": 1, "timezone_offset": "+01:00", "score_state": "PENDING_SCORE"}], "next_token": "token_3"},
+                 "token_3": {"records": [], "next_token": None}}
+        mocker.patch.object(self.whoop_ingestor, "get_json", side_effect=lambda base_url, cycles_url, endpoint, params: pages[params.get('nextToken')])
+        mocker.patch.object(self.whoop_ingestor.whoop_database, "get_checkpoints", return_value=[])
+        mock_upsert_checkpoint = mocker.patch.object(self.whoop_ingestor.whoop_database, "upsert_checkpoint")
+        mock_complete_checkpoint = mocker.patch.object(self.whoop_ingestor.whoop_database, "complete_checkpoint")
+        mock_load = mocker.patch.object(self.whoop_ingestor, "load_endpoint", return_value={"max_updated_at": None})
+        self.whoop_ingestor.endpoints = {'fact_cycle': 'cycle'}
+
+        self.whoop_ingestor.data_pipeline("2025-01-01T00:00:00.000Z", "2025-01-02T00:00:00.000Z", pages_per_chunk=2)
+
+        assert [len(call.args[2]) for call in mock_load.call_args_list] == [2, 0]
+        assert [call.kwargs['next_token'] for call in mock_upsert_checkpoint.call_args_list] == ["token_3"]
+        mock_complete_checkpoint.assert_called_once() # the empty final page still ends the window's crawl
+
+    def test_incremental_data_pipeline_uses_endpoint_watermarks(self, mocker):
+        watermark = pd.Timestamp("2025-01-10T00:00:00Z")
+        mocker.patch.object(self.whoop_ingestor.whoop_database, "get_watermark", return_value=watermark)
+        mock_chunks = mocker.patch.object(self.whoop_ingestor, "endpoint_chunks", return_value=[
+            (pd.DataFrame({'cycle_id': [1, 2], 'updated_at': pd.to_datetime(["2025-01-09T00:00:00Z", "2025-01-11T00:00:00Z"])}), None)])
+        mock_load = mocker.patch.object(self.whoop_ingestor, "load_endpoint", return_value={"max_updated_at": pd.Timestamp("2025-01-11T00:00:00Z")})
+        mock_upsert_watermark = mocker.patch.object(self.whoop_ingestor.whoop_database, "upsert_watermark")
+        self.whoop_ingestor.endpoints = {'fact_cycle': 'cycle'}
+
+        self.whoop_ingestor.data_pipeline("2025-01-01T00:00:00.000Z", "2025-01-12T00:00:00.000Z", incremental=True)
+
+        assert mock_chunks.call_args.args[1] == "2025-01-08T00:00:00.000Z" # watermark less the 48 hour lookback
+        assert list(mock_load.call_args.args[2]['cycle_id']) == [2]
+        mock_upsert_watermark.assert_called_once_with('cycle', pd.Timestamp("2025-01-11T00:00:00Z"), session=None) # loaded in one go, so the window is complete
+
+    def test_resumed_window_keeps_its_watermark_until_it_completes(self, mocker):
+        started_with = pd.Timestamp("2025-01-05T00:00:00Z")
+        checkpoint = {'endpoint': 'cycle', 'window_start': "2025-01-01T00:00:00.000Z", 'window_end': "2025-01-12T00:00:00.000Z", 'next_token': "token_2",
+                      'watermark': started_with}
+        pages = {"token_2": {"records": [{"id": 2, "user_id": 1, "updated_at": "2025-01-08T00:00:00.000Z", "timezone_offset": "+01:00"}], "next_token": "token_3"},
+                 "token_3": {"records": [{"id": 1, "user_id": 1, "updated_at": "2025-01-06T00:00:00.000Z", "timezone_offset": "+01:00"}], "next_token": None}}
+        mocker.patch.object(self.whoop_ingestor, "get_json", side_effect=lambda base_url, cycles_url, endpoint, params: pages.get(params.get('nextToken'), {"records": [], "next_token": None}))
+        mocker.patch.object(self.whoop_ingestor.whoop_database, "get_checkpoints", return_value=[checkpoint])
+        mocker.patch.object(self.whoop_ingestor.whoop_database, "get_watermark", return_value=pd.Timestamp("2025-01-09T00:00:00Z")) # moved on since
+        mock_upsert_checkpoint = mocker.patch.object(self.whoop_ingestor.whoop_database, "upsert_checkpoint")
+        mock_complete_checkpoint = mocker.patch.object(self.whoop_ingestor.whoop_database, "complete_checkpoint")
+        mock_upsert_watermark = mocker.patch.object(self.whoop_ingestor.whoop_database, "upsert_watermark")
+        mock_load = mocker.patch.object(self.whoop_ingestor, "load_endpoint",
+                                        side_effect=lambda endpoint_key, endpoint, df, session=None: {"max_updated_at": df['updated_at'].max() if not df.empty else None})
+        self.whoop_ingestor.endpoints = {'fact_cycle': 'cycle'}
+
+        self.whoop_ingestor.data_pipeline("2025-01-01T00:00:00.000Z", "2025-01-12T00:00:00.000Z", pages_per_chunk=1, incremental=True)
+
+        assert [list(call.args[2]['cycle_id']) for call in mock_load.call_args_list[:2]] == [[2], [1]] # cycle 1 is newer than the watermark the window started with
+        assert mock_upsert_checkpoint.call_args.kwargs['max_updated_at'] == pd.Timestamp("2025-01-08T00:00:00Z")
+        assert mock_complete_checkpoint.call_args_list[0].args[3] == pd.Timestamp("2025-01-06T00:00:00Z")
+        mock_upsert_watermark.assert_not_called()
+
+    def test_split_date_range(self):
+        windows = self.whoop_ingestor.split_date_range("2024-01-15T00:00:00.000Z", "2024-03-10T12:00:00.000Z", window='month')
+
+        assert windows == [("2024-01-15T00:00:00.000Z", "2024-02-01T00:00:00.000Z"),
+                           ("2024-02-01T00:00:00.000Z", "2024-03-01T00:00:00.000Z"),
+                           ("2024-03-01T00:00:00.000Z", "2024-03-10T12:00:00.000Z")]
+
+    def mock_backfill_checkpoints(self, mocker, unfinished:list=None):
+        """Mocks the crawl_checkpoints calls of backfill_pipeline, returning unfinished as the checkpoints left by an earlier run."""
+        mocker.patch.object(self.whoop_ingestor.whoop_database, "get_checkpoints",
+                            side_effect=lambda endpoint: [checkpoint for checkpoint in unfinished or [] if checkpoint['endpoint'] == endpoint])
+        return (mocker.patch.object(self.whoop_ingestor.whoop_database, "upsert_checkpoint"),
+                mocker.patch.object(self.whoop_ingestor.whoop_database, "complete_checkpoint"))
+
+    def test_backfill_pipeline_loads_each_window(self, mocker):
+        def fake_fetch(endpoint, start_date, end_date, limit=25):
+            if endpoint != 'cycle':
+                return pd.DataFrame()
+            if start_date.startswith("2024-01"):
+                return pd.DataFrame({'cycle_id': [1, 2, 2], 'updated_at': pd.to_datetime(["2024-01-02", "2024-03-01", "2024-03-01"], utc=True)})
+            return pd.DataFrame({'cycle_id': [2, 3], 'updated_at': pd.to_datetime(["2024-03-01", "2024-02-02"], utc=True)}) # cycle 2 spans both windows
+
+        mocker.patch.object(self.whoop_ingestor, "fetch_endpoint", side_effect=fake_fetch)
+        mock_load = mocker.patch.object(self.whoop_ingestor, "load_endpoint",
+                                        side_effect=lambda endpoint_key, endpoint, df, session=None: {"max_updated_at": df['updated_at'].max() if not df.empty else None})
+        mock_upsert_checkpoint, mock_complete_checkpoint = self.mock_backfill_checkpoints(mocker)
+        reset_timings = mocker.patch.object(self.whoop_ingestor.data_quality_validator, "reset_timings")
+
+        self.whoop_ingestor.backfill_pipeline("2024-01-01T00:00:00.000Z", "2024-02-15T00:00:00.000Z", window='month')
+
+        assert [call.args[0] for call in mock_load.call_args_list] == ['fact_cycle'] * 2 + ['fact_activity_sleep'] * 2 + ['fact_recovery'] * 2 + ['fact_workout'] * 2
+        assert [list(call.args[2]['cycle_id']) for call in mock_load.call_args_list[:2]] == [[1, 2], [2, 3]] # duplicates dropped within each window
+        assert mock_upsert_checkpoint.call_count == mock_complete_checkpoint.call_count == 2 * 4 # every window is checkpointed until it has loaded
+        assert mock_complete_checkpoint.call_args_list[1].args == ('cycle', "2024-02-01T00:00:00.000Z", "2024-02-15T00:00:00.000Z", pd.Timestamp("2024-03-01", tz="UTC"))
+        reset_timings.assert_called_once()
+
+    def test_backfill_pipeline_bounds_pending_windows(self, mocker, monkeypatch):
+        monkeypatch.setattr(settings, "whoop_backfill_max_pending_windows", 2)
+        held, lock = {'windows': 0, 'most': 0}, threading.Lock() # windows fetched and not yet loaded
+
+        def fake_fetch(endpoint, start_date, end_date, limit=25):
+            with lock:
+                held['windows'] += 1
+                held['most'] = max(held['most'], held['windows'])
+            return pd.DataFrame()
+
+        def fake_load(endpoint_key, endpoint, df, session=None):
+            with lock:
+                held['windows'] -= 1
+            return {"max_updated_at": None}
+
+        mocker.patch.object(self.whoop_ingestor, "fetch_endpoint", side_effect=fake_fetch)
+        mock_load = mocker.patch.object(self.whoop_ingestor, "load_endpoint", side_effect=fake_load)
+        self.mock_backfill_checkpoints(mocker)
+
+        self.whoop_ingestor.backfill_pipeline("2024-01-01T00:00:00.000Z", "2025-01-01T00:00:00.000Z", window='month')
+
+        assert mock_load.call_count == 12 * 4
+        assert held['most'] <= 3 # the window loading and the two fetched ahead of it
+
+    def test_backfill_pipeline_cancels_pending_fetches_on_failure(self, mocker):
+        def fake_fetch(endpoint, start_date, end_date, limit=25):
+            if endpoint == 'cycle' and start_date.startswith("2024-01"):
+                raise requests.HTTPError("500 Server Error")
+            time.sleep(0.05)
+            return pd.DataFrame()
+
+        mock_fetch = mocker.patch.object(self.whoop_ingestor, "fetch_endpoint", side_effect=fake_fetch)
+        mocker.patch.object(self.whoop_ingestor, "load_endpoint")
+        self.mock_backfill_checkpoints(mocker)
+
+        with pytest.raises(requests.HTTPError):
+            self.whoop_ingestor.backfill_pipeline("2024-01-01T00:00:00.000Z", "2025-01-01T00:00:00.000Z", window='month')
+
+        assert mock_fetch.call_count < 12 * 4 # windows queued behind the failure were never fetched
+
+    def test_interrupted_backfill_is_resumed(self, mocker):
+        def fake_fetch(endpoint, start_date, end_date, limit=25):
+            if endpoint == 'activity/sleep' and start_date.startswith("2024-02"):
+                raise requests.ConnectionError("killed midway")
+            return pd.DataFrame()
+
+        mocker.patch.object(self.whoop_ingestor, "fetch_endpoint", side_effect=fake_fetch)
+        mocker.patch.object(self.whoop_ingestor, "load_endpoint", return_value={"max_updated_at": None})
+        mock_upsert_checkpoint, mock_complete_checkpoint = self.mock_backfill_checkpoints(mocker)
+
+        with pytest.raises(requests.ConnectionError):
+            self.whoop_ingestor.backfill_pipeline("2024-01-01T00:00:00.000Z", "2024-03-15T00:00:00.000Z", window='month')
+
+        completed = {call.args[:3] for call in mock_complete_checkpoint.call_args_list}
+        unfinished = [call.args[:3] for call in mock_upsert_checkpoint.call_args_list if call.args[:3] not in completed]
+        assert ('activity/sleep', "2024-02-01T00:00:00.000Z", "2024-03-01T00:00:00.000Z") in unfinished
+        assert all(endpoint != 'cycle' for endpoint, _, _ in unfinished) # every cycle window loaded before the sleeps
+
+        checkpoints = [{'endpoint': endpoint, 'window_start': window_start, 'window_end': window_end, 'next_token': '', 'watermark': None}
+                       for endpoint, window_start, window_end in unfinished]
+        pages = mocker.patch.object(self.whoop_ingestor, "get_json", return_value={"records": [], "next_token": None})
+        mocker.patch.object(self.whoop_ingestor.whoop_database, "get_checkpoints",
+                            side_effect=lambda endpoint: [checkpoint for checkpoint in checkpoints if checkpoint['endpoint'] == endpoint])
+        self.whoop_ingestor.endpoints = {'fact_activity_sleep': 'activity/sleep'}
+
+        self.whoop_ingestor.data_pipeline("2024-03-10T00:00:00.000Z", "2024-03-15T00:00:00.000Z", pages_per_chunk=1) # the next, incremental, run
+
+        resumed = [call.args[3] for call in pages.call_args_list]
+        assert resumed[0] == {'limit': 25, 'start': "2024-02-01T00:00:00.000Z", 'end': "2024-03-01T00:00:00.000Z"} # from its first page, without a nextToken
+
+    def test_get_json_retries_rate_limited_requests(self, mocker):
+        mock_sleep = mocker.patch("whoop_pipeline.rate_limiter.time.sleep")
+        rate_limited = mocker.Mock(status_code=429, headers={"Retry-After": "7"})
+        server_error = mocker.Mock(status_code=503, headers={})
+        success = mocker.Mock(status_code=200, headers={}, content=b'{"records": [], "next_token": null}')
+        success.json.return_value = {"records": [], "next_token": None}
+        mocker.patch.object(self.whoop_ingestor.http_session, "get", side_effect=[rate_limited, server_error, success])
+
+        response_json = self.whoop_ingestor.get_json(None, None, "cycle", {"limit": 25})
+
+        assert response_json == {"records": [], "next_token": None}
+        assert any(call.args[0] >= 6.9 for call in mock_sleep.call_args_list) # Retry-After is honoured
+        metrics = self.whoop_ingestor.rate_limiter.metrics()
+        assert metrics["retries"] == 2
+        assert metrics["rate_limited_responses"] == 1
+        assert metrics["throttled_seconds"] >= 6.9
+        fetch = self.whoop_ingestor.metrics.summary()[0]
+        assert (fetch["stage"], fetch["pages"], fetch["retries"], fetch["bytes"]) == ("fetch", 1, 2, 35)
+
+    def test_get_json_raises_after_max_retries(self, mocker):
+        mocker.patch("whoop_pipeline.rate_limiter.time.sleep")
+        server_error = mocker.Mock(status_code=500, headers={})
+        server_error.raise_for_status.side_effect = requests.HTTPError("500 Server Error")
+        mocker.patch.object(self.whoop_ingestor.http_session, "get", return_value=server_error)
+
+        with pytest.raises(requests.HTTPError):
+            self.whoop_ingestor.get_json(None, None, "cycle", {"limit": 25})
+
+    def test_rate_limiter_spaces_requests(self):
+        rate_limiter = RateLimiter(requests_per_minute=600) # one request every 0.1 seconds
+        start_time = time.monotonic()
+        for _ in range(3):
+            rate_limiter.wait()
+
+        assert time.monotonic() - start_time >= 0.2
+
+    def test_load_endpoint_quarantines_invalid_records(self, mocker):
+        whoop_ingestor = WhoopDataIngestor(access_token="test_access_token", validation_mode='quarantine')
+        records = [{"id": cycle_id, "user_id": 1, "created_at": "2025-01-01T00:00:00.000Z", "updated_at": "2025-01-01T00:00:00.000Z",
+                    "start": "2025-01-01T00:00:00.000Z", "end": "2025-01-02T00:00:00.000Z", "timezone_offset": "+01:00", "score_state": "SCORED",
+                    "score": {"strain": strain, "kilojoule": 9000.0, "average_heart_rate": 70, "max_heart_rate": 180}}
+                   for cycle_id, strain in [(1, 10.0), (2, 35.0), (3, 12.0)]]
+        df = whoop_ingestor.records_to_frame(records, 'cycle')
+        mock_quarantine = mocker.patch.object(whoop_ingestor.whoop_database, "quarantine_rows")
+        mock_upsert = mocker.patch.object(whoop_ingestor.whoop_database, "upsert_data")
+        mocker.patch.object(whoop_ingestor.whoop_database, "upsert_watermark")
+
+        whoop_ingestor.load_endpoint('fact_cycle', 'cycle', df)
+
+        rejected = mock_quarantine.call_args.args[1]
+        assert list(rejected['cycle_id']) == [2]
+        assert list(rejected['failed_rules']) == ['strain_range']
+        assert [row['cycle_id'] for row in mock_upsert.call_args.args[3]] == [1, 3]
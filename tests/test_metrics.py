@@ -0,0 +1,55 @@
+from whoop_pipeline.ingest_data import WhoopDataIngestor
+from whoop_pipeline.metrics import PipelineMetrics, STAGES
+from whoop_pipeline.replay import ReplaySource
+import json
+import pytest
+
+
+class TestPipelineMetrics():
+    def setup_method(self, method):
+        self.metrics = PipelineMetrics()
+
+    def teardown_method(self, method):
+        pass
+
+    def test_stages_accumulate_per_endpoint(self):
+        for _ in range(2):
+            with self.metrics.stage('cycle', 'fetch') as fetch:
+                fetch['pages'] += 1
+                fetch['bytes'] += 100
+        with pytest.raises(ValueError):
+            with self.metrics.stage('cycle', 'validate', rows=10):
+                raise ValueError("failed validation")
+
+        fetch, validate = self.metrics.summary()
+        assert (fetch['stage'], fetch['calls'], fetch['pages'], fetch['bytes']) == ('fetch', 2, 2, 200)
+        assert (validate['stage'], validate['calls'], validate['rows']) == ('validate', 1, 10) # failed stages are still recorded
+        assert fetch['peak_memory_bytes'] > 0
+
+    def test_writes_prometheus_textfile(self, tmp_path):
+        self.metrics.record('activity/sleep', 'upsert', 1.5, rows=25)
+        path = tmp_path / "whoop_pipeline.prom"
+
+        self.metrics.write_textfile(path)
+
+        lines = path.read_text().splitlines()
+        assert "# TYPE whoop_pipeline_stage_seconds gauge" in lines
+        assert 'whoop_pipeline_stage_seconds{endpoint="activity/sleep",stage="upsert"} 1.5' in lines
+        assert 'whoop_pipeline_stage_rows{endpoint="activity/sleep",stage="upsert"} 25' in lines
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_data_pipeline_emits_every_stage(self, mocker, capsys, tmp_path):
+        whoop_ingestor = WhoopDataIngestor(access_token="replay", page_source=ReplaySource(), validation_mode='quarantine')
+        mocker.patch.object(whoop_ingestor.whoop_database, "upsert_data", return_value={"inserted": 0, "updated": 0, "unchanged": 0})
+        mocker.patch.object(whoop_ingestor.whoop_database, "upsert_watermark")
+        mocker.patch.object(whoop_ingestor.whoop_database, "quarantine_rows")
+        mocker.patch("whoop_pipeline.ingest_data.settings.whoop_metrics_textfile", str(tmp_path / "whoop_pipeline.prom"))
+
+        whoop_ingestor.data_pipeline("2025-08-01T00:00:00.000Z", "2025-10-01T00:00:00.000Z")
+
+        events = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{')]
+        stages = {(event['endpoint'], event['stage']): event for event in events if event['event'] == 'pipeline_stage'}
+        assert [stage for endpoint, stage in stages if endpoint == 'cycle'] == STAGES
+        assert stages[('cycle', 'fetch')]['pages'] == 1 and stages[('cycle', 'upsert')]['rows'] == 25
+        assert events[-1]['event'] == 'pipeline_run'
+        assert 'whoop_pipeline_stage_rows{endpoint="recovery",stage="clean"} 10' in (tmp_path / "whoop_pipeline.prom").read_text()
@@ -0,0 +1,69 @@
+from whoop_pipeline.ingest_data import WhoopDataIngestor
+from whoop_pipeline.mock_server import MockWhoopServer, SyntheticDataGenerator
+from whoop_pipeline.rate_limiter import RateLimiter
+import pandas as pd
+import requests
+import os
+import subprocess
+import sys
+
+
+class TestMockWhoopServer():
+    def setup_method(self, method):
+        self.generator = SyntheticDataGenerator(records=1000, start="2024-01-01T00:00:00.000Z", end="2024-02-01T00:00:00.000Z")
+        self.start_date = "2024-01-03T00:00:00.000Z"
+        self.end_date = "2024-01-05T00:00:00.000Z"
+
+    def teardown_method(self, method):
+        pass
+
+    def test_pages_cover_the_window_newest_first(self):
+        records, next_token = [], None
+        while True:
+            page = self.generator.page('cycle', self.start_date, self.end_date, 25, next_token)
+            records.extend(page["records"])
+            next_token = page["next_token"]
+            if next_token is None:
+                break
+
+        starts = pd.to_datetime([record['start'] for record in records])
+        assert len(records) == len(self.generator.window_indices('cycle', self.start_date, self.end_date)) == 65
+        assert len({record['id'] for record in records}) == len(records)
+        assert starts.is_monotonic_decreasing
+        assert starts.min() >= pd.Timestamp(self.start_date) and starts.max() < pd.Timestamp(self.end_date)
+
+    def test_records_are_stable_and_linked(self):
+        sleep = self.generator.record('activity/sleep', 7)
+        recovery = self.generator.record('recovery', 7)
+
+        assert sleep == SyntheticDataGenerator(records=1000, start="2024-01-01T00:00:00.000Z", end="2024-02-01T00:00:00.000Z").record('activity/sleep', 7)
+        assert (recovery['sleep_id'], recovery['cycle_id']) == (sleep['id'], sleep['cycle_id']) == (sleep['id'], self.generator.record('cycle', 7)['id'])
+
+    def test_rejects_bad_requests(self):
+        with MockWhoopServer(self.generator) as server:
+            unauthorized = requests.get(f"{server.base_url}cycle")
+            too_large = requests.get(f"{server.base_url}cycle", params={'limit': 26}, headers={"Authorization": "Bearer token"})
+            unknown = requests.get(f"{server.base_url}body_measurement", headers={"Authorization": "Bearer token"})
+
+        assert [unauthorized.status_code, too_large.status_code, unknown.status_code] == [401, 400, 404]
+
+    def test_ingestor_fetches_through_injected_rate_limits(self):
+        with MockWhoopServer(self.generator, throttle_rate=0.3, retry_after_seconds=0) as server:
+            whoop_ingestor = WhoopDataIngestor(access_token="test_access_token", parse_method='direct')
+            whoop_ingestor.base_url = whoop_ingestor.cycles_base_url = server.base_url
+            whoop_ingestor.rate_limiter = RateLimiter(60_000)
+            dfs = {endpoint: whoop_ingestor.fetch_endpoint(endpoint, self.start_date, self.end_date) for endpoint in whoop_ingestor.model_classes}
+            whoop_ingestor.close()
+
+        for endpoint, df in dfs.items():
+            whoop_ingestor.data_quality_validator.assertion_tests(df, whoop_ingestor.model_classes[endpoint])
+        assert [len(df) for df in dfs.values()] == [65, 65, 64, 65]
+        assert server.metrics()["throttled"] == whoop_ingestor.rate_limiter.metrics()["rate_limited_responses"] > 0
+
+    def test_server_starts_without_pipeline_settings(self, tmp_path):
+        env = {'PATH': os.environ.get('PATH', ''), 'PYTHONPATH': os.pathsep.join(sys.path)} # no DB_URL, WHOOP client secrets or API URLs
+        result = subprocess.run([sys.executable, "-c", "from whoop_pipeline.mock_server import MockWhoopServer, SyntheticDataGenerator; "
+                                 "server = MockWhoopServer(SyntheticDataGenerator(10)); print(server.base_url); server.httpd.server_close()"],
+                                cwd=tmp_path, env=env, capture_output=True, text=True) # run outside the repo so no .env file is picked up
+
+        assert result.returncode == 0, result.stderr
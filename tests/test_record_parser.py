@@ -0,0 +1,48 @@
+from whoop_pipeline.data_cleaning import WhoopDataCleaner
+from whoop_pipeline.models import Cycle, Sleep, Recovery, Workout
+from whoop_pipeline.record_parser import RecordParser
+from pathlib import Path
+import json
+import pandas as pd
+
+DATA_PATH = Path(__file__).resolve().parents[1] / "data"
+
+
+class TestRecordParser():
+    def setup_method(self, method):
+        self.whoop_data_cleaner = WhoopDataCleaner()
+
+    def teardown_method(self, method):
+        pass
+
+    def assert_matches_clean_data(self, records, endpoint, model_class):
+        expected = self.whoop_data_cleaner.clean_data(pd.json_normalize(records), endpoint, model_class)
+        expected = expected[[col.name for col in model_class.__table__.columns]]
+        parsed = RecordParser(endpoint, model_class).parse(records)
+
+        pd.testing.assert_frame_equal(parsed, expected)
+
+    def test_parse_matches_clean_data_for_cycles(self):
+        with open(DATA_PATH / "cycle_data.json") as f:
+            records = json.load(f)["records"]
+        records.append({"id": 99, "user_id": 1, "created_at": "2025-01-01T00:00:00.000Z", "updated_at": "2025-01-01T00:00:00.000Z",
+                        "start": "2025-01-01T00:00:00.000Z", "end": None, "timezone_offset": "-05:00", "score_state": "PENDING_SCORE"})
+
+        self.assert_matches_clean_data(records, "cycle", Cycle)
+
+    def test_parse_matches_clean_data_for_nested_scores(self):
+        sleep = {"id": "a1", "cycle_id": 1, "user_id": 1, "created_at": "2025-01-01T08:00:00.000Z", "updated_at": "2025-01-01T08:00:00.000Z",
+                 "start": "2025-01-01T00:00:00.000Z", "end": "2025-01-01T08:00:00.000Z", "timezone_offset": "+01:00", "nap": False,
+                 "score_state": "SCORED", "score": {"stage_summary": {"total_in_bed_time_milli": 28800000, "disturbance_count": 3},
+                                                     "sleep_needed": {"baseline_milli": 27000000}, "respiratory_rate": 15.2,
+                                                     "sleep_performance_percentage": 91, "sleep_efficiency_percentage": None}}
+        recovery = {"cycle_id": 1, "sleep_id": "a1", "user_id": 1, "created_at": "2025-01-01T08:00:00.000Z", "updated_at": "2025-01-01T08:00:00.000Z",
+                    "score_state": "SCORED", "score": {"user_calibrating": False, "recovery_score": 66, "resting_heart_rate": 52, "hrv_rmssd_milli": 48.5}}
+        workout = {"id": "w1", "user_id": 1, "created_at": "2025-01-01T18:00:00.000Z", "updated_at": "2025-01-01T18:00:00.000Z",
+                   "start": "2025-01-01T17:00:00.000Z", "end": "2025-01-01T18:00:00.000Z", "timezone_offset": "+01:00", "sport_name": "running",
+                   "score_state": "SCORED", "score": {"strain": 12.4, "average_heart_rate": 150, "zone_durations": {"zone_one_milli": 600000}}}
+        unscored = {"user_id": 1, "created_at": "2025-01-02T08:00:00.000Z", "updated_at": "2025-01-02T08:00:00.000Z", "score_state": "UNSCORABLE"}
+
+        self.assert_matches_clean_data([sleep, {**sleep, "id": "a2", "score": None, "score_state": "UNSCORABLE"}], "activity/sleep", Sleep)
+        self.assert_matches_clean_data([recovery, {**unscored, "cycle_id": 2, "sleep_id": "a2"}], "recovery", Recovery)
+        self.assert_matches_clean_data([workout, {**unscored, "id": "w2"}], "activity/workout", Workout)
@@ -0,0 +1,68 @@
+from whoop_pipeline.cache import RawPageCache
+from whoop_pipeline.ingest_data import WhoopDataIngestor
+from whoop_pipeline.replay import ReplaySource, DATA_PATH
+import json
+
+
+class TestReplaySource():
+    def setup_method(self, method):
+        self.replay_source = ReplaySource()
+        self.whoop_ingestor = WhoopDataIngestor(access_token="replay", page_source=self.replay_source)
+        self.start_date = "2025-08-01T00:00:00.000Z"
+        self.end_date = "2025-10-01T00:00:00.000Z"
+
+    def teardown_method(self, method):
+        pass
+
+    def test_cycle_fixture_pages(self):
+        with open(DATA_PATH / "cycle_data.json") as f:
+            records = json.load(f)["records"]
+
+        first_page = self.replay_source.get_json('cycle', {'limit': 10, 'start': self.start_date, 'end': self.end_date})
+        last_page = self.replay_source.get_json('cycle', {'limit': 10, 'start': self.start_date, 'end': self.end_date, 'nextToken': "20"})
+
+        assert first_page == {"records": records[:10], "next_token": "10"}
+        assert last_page == {"records": records[20:], "next_token": None}
+
+    def test_csv_fixtures_are_unflattened_into_api_records(self):
+        sleep = self.replay_source.fixture_records('activity/sleep')[0]
+        workout = self.replay_source.fixture_records('activity/workout')[0]
+
+        assert sleep['timezone_offset'] == "+01:00"
+        assert sleep['start'] == "2025-09-01T22:28:25.143Z"
+        assert sleep['score']['stage_summary']['total_in_bed_time_milli'] == 23572094
+        assert workout['score']['zone_durations']['zone_one_milli'] == 2824314
+        assert 'distance_meter' not in workout['score'] # empty cells are left out, as the API omits them
+
+    def test_sleep_ids_are_derived_from_recoveries(self):
+        sleeps = self.replay_source.fixture_records('activity/sleep')
+        recovery_sleep_ids = {recovery['cycle_id']: recovery['sleep_id'] for recovery in self.replay_source.fixture_records('recovery')}
+
+        assert len({sleep['id'] for sleep in sleeps}) == len(sleeps) # the export holds 0 for every sleep id
+        assert [sleep['id'] for sleep in sleeps if sleep['cycle_id'] in recovery_sleep_ids] == \
+               [recovery_sleep_ids[sleep['cycle_id']] for sleep in sleeps if sleep['cycle_id'] in recovery_sleep_ids]
+        assert ReplaySource().fixture_records('activity/sleep') == sleeps # derived ids are the same on every replay
+
+    def test_window_filters_records(self):
+        page = self.replay_source.get_json('activity/workout', {'limit': 25, 'start': "2025-08-26T00:00:00.000Z", 'end': "2025-08-27T00:00:00.000Z"})
+
+        assert page["records"] and all(record['start'].startswith("2025-08-26") for record in page["records"])
+
+    def test_cached_pages_are_replayed_first(self, tmp_path):
+        page_cache = RawPageCache(tmp_path, ttl_seconds=0)
+        params = {'limit': 25, 'start': self.start_date, 'end': self.end_date}
+        page = {"records": [{"id": 1}], "next_token": None}
+        page_cache.put('cycle', params, page)
+
+        assert ReplaySource(page_cache=page_cache).get_json('cycle', params) == page # expired pages are still replayed
+
+    def test_data_pipeline_replays_fixtures(self, mocker):
+        mock_load = mocker.patch.object(self.whoop_ingestor, "load_endpoint", return_value={"max_updated_at": None})
+
+        self.whoop_ingestor.data_pipeline(self.start_date, self.end_date)
+
+        loaded = {call.args[0]: call.args[2] for call in mock_load.call_args_list}
+        assert list(loaded) == ['fact_cycle', 'fact_activity_sleep', 'fact_recovery', 'fact_workout']
+        assert [len(df) for df in loaded.values()] == [25, 10, 10, 10]
+        assert loaded['fact_activity_sleep']['timezone_offset'].eq(60).all()
+        assert loaded['fact_recovery']['recovery_score'].dtypes == 'Int64'